@@ -1,131 +1,1584 @@
 import streamlit as st
-import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from datetime import datetime
+from collections import OrderedDict, namedtuple, deque
+from types import MappingProxyType
 import os
+import sys
+import io
 import time
 import base64
+import hashlib
+import hmac
+import threading
+import re
+import unicodedata
+import difflib
+import json
+import uuid
+import sqlite3
+import logging
+import importlib.util
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 
 # --- CONFIGURATION ---
 SHEET_NAME = "Sondage_Hassi_Elbekay"
 CREDENTIALS_FILE = "credentials.json"
 MAX_ENFANTS_PREVISION = 15
+DATA_DIR = "donnees_locales"
+AUDIO_DIR = os.path.join(DATA_DIR, "audio")
+AUDIO_CACHE_MAX_BYTES = 32 * 1024 * 1024
+SUCCESS_MSG = "Opération réussie !"
+SEARCH_FIELDS = ["ChefFamille", "NomFamille", "Tel", "CNI"]
+DUP_THRESHOLD = 0.45
+DUP_GPS_DECIMALS = 3
+JOURNAL_PATH = os.path.join(DATA_DIR, "journal.db")
+FLUSH_INTERVAL = 10
+FLUSH_BATCH = 200
+FLUSH_MAX_BACKOFF = 600
+FLUSH_LEASE = 300
+REPLICA_PATH = os.path.join(DATA_DIR, "replique.db")
+REPLICA_POLL_SECONDS = 30
+REPLICA_BLOCK = 500
+REPLICA_OVERLAY_SECONDS = 3600
+# Stockage "large" : une ligne par ménage avec les colonnes Enfant_i_* (historique)
+# Stockage "long"  : onglet Menages + onglet Enfants (une ligne par enfant) liés par ID_Menage
+STORAGE_MODE = os.environ.get("SONDAGE_STOCKAGE", "large")
+HOUSEHOLD_SHEET = "Menages"
+CHILD_SHEET = "Enfants"
+# Photos : recompressées par le serveur Streamlit puis copiées en arrière-plan vers le stockage distant.
+# Budget réglable : côté max en pixels (SONDAGE_PHOTO_COTE), qualité JPEG de départ (SONDAGE_PHOTO_QUALITE)
+# et taille max en Ko (SONDAGE_PHOTO_KO)
+PHOTO_DIR = os.path.join(DATA_DIR, "photos")
+PHOTO_REMOTE_DIR = os.environ.get("SONDAGE_PHOTOS_DISTANT", "")
+PHOTO_MAX_SIDE = int(os.environ.get("SONDAGE_PHOTO_COTE", "1280"))
+PHOTO_QUALITY = int(os.environ.get("SONDAGE_PHOTO_QUALITE", "75"))
+PHOTO_MAX_BYTES = int(os.environ.get("SONDAGE_PHOTO_KO", "250")) * 1024
+PHOTO_CHUNK = 256 * 1024
+# Tâches de fond (synthèse vocale anticipée) : exécuteur borné, les demandes en trop sont ignorées
+BACKGROUND_WORKERS = 2
+BACKGROUND_BACKLOG = 32
+JOB_POLL_SECONDS = 2
+JOB_HISTORY = 20
+# Traces (désactivées par défaut) : SONDAGE_TRACES=1. Panneau admin : ?admin=<jeton> dans l'URL,
+# le jeton étant SONDAGE_ADMIN_JETON (panneau désactivé si la variable n'est pas définie)
+TRACE_ENABLED = os.environ.get("SONDAGE_TRACES", "") == "1"
+ADMIN_TOKEN = os.environ.get("SONDAGE_ADMIN_JETON", "")
+TRACE_RING = 2000
+TRACE_SLOW_MS = 500
+TRACE_EXPORT_SECONDS = 15
+TRACE_METRICS_FILE = os.path.join(DATA_DIR, "metriques.prom")
+TRACE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CHILD_FIELDS = ["Nom", "Sexe", "Mere", "Niveau", "Pro", "Grade", "Act_Femme", "Sante", "Maladie", "Aide", "Orga"]
 
-try:
-    import gspread
-    from oauth2client.service_account import ServiceAccountCredentials
-    from gtts import gTTS
-    import io
-    LIBS_OK = True
-except ImportError:
-    LIBS_OK = False
-
-# --- LISTE DES QUESTIONS PRINCIPALES ---
-QUESTIONS_MAIN = [
-    {"id": "Q1", "key": "NomFamille", "fr": "1. Nom de la famille ?", "ar": "1. اسم الأسرة؟", "type": "text"},
-    {"id": "Q2", "key": "GrandeFamille", "fr": "2. Nom de la grande famille ?", "ar": "2. اسم الأسرة الكبيرة؟", "type": "text"},
-    {"id": "Q3", "key": "ChefFamille", "fr": "3. Nom du chef de famille ?", "ar": "3. اسم رب الأسرة؟", "type": "text"},
-    {"id": "Q4", "key": "Responsable", "fr": "4. Nom du responsable (si différent) ?", "ar": "4. اسم المسؤول (إذا كان مختلفًا)؟", "type": "text"},
-    {"id": "Q5", "key": "EnVie", "fr": "5. Le chef est-il en vie ?", "ar": "5. هل هو على قيد الحياة؟", "type": "radio", "opts_fr": ["Oui", "Non"], "opts_ar": ["نعم", "لا"]},
-    {"id": "Q6", "key": "Age", "fr": "6. Âge du chef ?", "ar": "6. العمر؟", "type": "number"},
-    {"id": "Q7", "key": "Sexe", "fr": "7. Sexe ?", "ar": "7. الجنس؟", "type": "radio", "opts_fr": ["Homme", "Femme"], "opts_ar": ["رجل", "امرأة"]},
-    {"id": "Q8", "key": "EtatCivil", "fr": "8. État civil ?", "ar": "8. الحالة الاجتماعية؟", "type": "radio", "opts_fr": ["Célibataire", "Marié(e)", "Divorcé(e)", "Veuf/Veuve"], "opts_ar": ["أعزب", "متزوج", "مطلق", "أرمل"]},
-    {"id": "Q9", "key": "Tel", "fr": "9. Numéro de téléphone ?", "ar": "9. رقم الهاتف؟", "type": "text"},
-    {"id": "Q10", "key": "CNI", "fr": "10. Numéro Carte d'Identité ?", "ar": "10. رقم بطاقة التعريف؟", "type": "text"},
-    {"id": "Q11", "key": "Localite", "fr": "11. Localité ?", "ar": "11. القرية؟", "type": "radio_autre", "opts_fr": ["Hassi El Bekay", "Autre"], "opts_ar": ["احسي البكاي", "أخرى"]},
-    {"id": "Q12", "key": "StatutLogement", "fr": "12. Statut du logement ?", "ar": "12. وضعية المسكن؟", "type": "radio_autre", "opts_fr": ["Propriétaire", "Locataire", "Hébergé(e)", "Autre"], "opts_ar": ["ملك", "إيجار", "ضيافة", "أخرى"]},
-    {"id": "Q13", "key": "AEnfants", "fr": "13. La famille a-t-elle des enfants ?", "ar": "13. هل لدى الأسرة أولاد؟", "type": "radio", "opts_fr": ["Oui", "Non"], "opts_ar": ["نعم", "لا"]},
-    {"id": "Q14", "key": "NbEnfants", "fr": "14. Nombre d'enfants ?", "ar": "14. عدد الأولاد؟", "type": "number"},
-    {"id": "Q26", "key": "Photo", "fr": "26. Photo du logement", "ar": "26. صورة للمسكن", "type": "camera"},
-    {"id": "Q27", "key": "GPS", "fr": "27. Coordonnées GPS", "ar": "27. إحداثيات GPS", "type": "gps"},
-]
+# Démarrage à froid : gspread, oauth2client, gTTS et pandas ne sont importés qu'au premier usage
+# (connexion au sheet, synthèse vocale, tableaux). Ici on vérifie seulement qu'ils sont installés.
+LIBS_OK = all(importlib.util.find_spec(m) is not None for m in ("gspread", "oauth2client", "gtts"))
+
+# --- TRACES (DUREES DES OPERATIONS LENTES) ---
+# Chaque opération instrumentée (gTTS, auth, lecture du sheet, envois) est chronométrée dans un
+# anneau en mémoire, agrégée en histogrammes Prometheus (fichier texte relu par node_exporter) et
+# journalisée en JSON sur le logger "sondage.traces". Désactivé, trace() renvoie un objet vide partagé.
+class _NoSpan:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def __bool__(self): return False
+    def set(self, **attrs): pass
+
+_NO_SPAN = _NoSpan()
+
+class Span:
+    def __init__(self, tracer, op, attrs):
+        self.tracer = tracer
+        self.op = op
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.record(self.op, time.perf_counter() - self.t0, exc is None, self.attrs, str(exc) if exc else None)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+class Tracer:
+    def __init__(self, size, metrics_file):
+        self.events = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.ops = {}
+        self.metrics_file = metrics_file
+        self.log = logging.getLogger("sondage.traces")
+        if not self.log.handlers:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.log.addHandler(handler)
+            self.log.setLevel(logging.INFO)
+            self.log.propagate = False
+        threading.Thread(target=self._loop, daemon=True, name="export-metriques").start()
+
+    def span(self, op, attrs):
+        return Span(self, op, attrs)
+
+    def record(self, op, seconds, ok, attrs, error=None):
+        ctx = get_script_run_ctx(suppress_warning=True)
+        event = {"ts": round(time.time(), 3), "op": op, "ms": round(seconds * 1000, 2), "ok": ok,
+                 "session": ctx.session_id[:8] if ctx else threading.current_thread().name, **attrs}
+        if error: event["erreur"] = error[:200]
+        with self.lock:
+            self.events.append(event)
+            agg = self.ops.setdefault(op, {"count": 0, "sum": 0.0, "errors": 0, "bytes": 0, "buckets": [0] * len(TRACE_BUCKETS)})
+            agg["count"] += 1
+            agg["sum"] += seconds
+            agg["errors"] += not ok
+            agg["bytes"] += attrs.get("octets", 0)
+            for i, le in enumerate(TRACE_BUCKETS):
+                if seconds <= le: agg["buckets"][i] += 1
+        self.log.info(json.dumps(event, ensure_ascii=False))
+
+    def recent(self, session=None, min_ms=0, limit=50):
+        with self.lock: events = list(self.events)
+        picked = [e for e in events if e["ms"] >= min_ms and (session is None or e["session"] == session)]
+        return picked[-limit:][::-1]
+
+    def prometheus(self):
+        with self.lock: ops = {op: {**a, "buckets": list(a["buckets"])} for op, a in self.ops.items()}
+        lines = ["# HELP sondage_operation_seconds Durée des opérations instrumentées", "# TYPE sondage_operation_seconds histogram"]
+        for op, a in sorted(ops.items()):
+            for le, n in zip(TRACE_BUCKETS, a["buckets"]): lines.append(f'sondage_operation_seconds_bucket{{op="{op}",le="{le}"}} {n}')
+            lines.append(f'sondage_operation_seconds_bucket{{op="{op}",le="+Inf"}} {a["count"]}')
+            lines.append(f'sondage_operation_seconds_sum{{op="{op}"}} {a["sum"]:.6f}')
+            lines.append(f'sondage_operation_seconds_count{{op="{op}"}} {a["count"]}')
+        lines += ["# HELP sondage_operation_errors_total Opérations terminées en erreur", "# TYPE sondage_operation_errors_total counter"]
+        lines += [f'sondage_operation_errors_total{{op="{op}"}} {a["errors"]}' for op, a in sorted(ops.items())]
+        lines += ["# HELP sondage_operation_bytes_total Octets traités (audio, lignes envoyées ou lues)", "# TYPE sondage_operation_bytes_total counter"]
+        lines += [f'sondage_operation_bytes_total{{op="{op}"}} {a["bytes"]}' for op, a in sorted(ops.items())]
+        return "\n".join(lines) + "\n"
+
+    def _loop(self):
+        while True:
+            time.sleep(TRACE_EXPORT_SECONDS)
+            try:
+                os.makedirs(os.path.dirname(self.metrics_file), exist_ok=True)
+                tmp = self.metrics_file + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f: f.write(self.prometheus())
+                os.replace(tmp, self.metrics_file)
+            except OSError: pass
+
+@st.cache_resource
+def get_tracer():
+    return Tracer(TRACE_RING, TRACE_METRICS_FILE)
+
+def trace(op, **attrs):
+    if not TRACE_ENABLED: return _NO_SPAN
+    return get_tracer().span(op, attrs)
+
+def _payload_bytes(rows):
+    return len(json.dumps(rows, ensure_ascii=False).encode("utf-8"))
+
+# --- QUESTIONNAIRE (DEFINITION DECLARATIVE COMPILEE) ---
+# Le questionnaire est décrit dans un fichier JSON (questions, sauts, boucle enfants et ses champs
+# conditionnels, options enfants) et compilé au premier usage, une fois par processus, en une structure immuable : index id -> position,
+# dictionnaires option -> index par langue, table des sauts. Le rendu ne fait plus que des lookups.
+SURVEY_FILE = os.environ.get("SONDAGE_QUESTIONNAIRE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "questionnaire.json"))
+QUESTION_TYPES = {"text", "number", "radio", "radio_autre", "camera", "gps"}
+LANGS = ("fr", "ar")
+# Champs enfant affichés en liste de choix par la boucle enfants (options obligatoires)
+CHILD_CHOICE_FIELDS = ("Sexe", "Niveau", "Pro", "Grade", "Sante", "Maladie", "Aide")
+# Champs conditionnels de la boucle enfants -> choix qui les déclenche ; les valeurs déclenchantes
+# viennent de boucle_enfants.conditions du questionnaire
+CHILD_CONDITIONAL_FIELDS = {"Grade": "Pro", "Act_Femme": "Sexe", "Maladie": "Sante", "Orga": "Aide"}
+
+Survey = namedtuple("Survey", ["title", "questions", "index_of", "options", "option_index", "jumps",
+                               "child_trigger", "child_count_key", "child_after", "child_options", "child_option_index",
+                               "child_conditions"])
+
+def compile_survey(doc):
+    errors = []
+    questions = doc.get("questions") or []
+    if not questions: errors.append("Aucune question")
+    index_of, options, option_index, seen_keys = {}, {}, {}, set()
+    for i, q in enumerate(questions):
+        qid = q.get("id")
+        if not qid or qid in index_of: errors.append(f"Question {i + 1} : id manquant ou en double ({qid})")
+        index_of[qid] = i
+        if q.get("key") in seen_keys: errors.append(f"{qid} : clé '{q.get('key')}' en double")
+        seen_keys.add(q.get("key"))
+        if q.get("type") not in QUESTION_TYPES: errors.append(f"{qid} : type inconnu '{q.get('type')}'")
+        for lc in LANGS:
+            if not q.get(lc): errors.append(f"{qid} : libellé '{lc}' manquant")
+        if q.get("type") in ("radio", "radio_autre"):
+            opts = {lc: tuple(q.get(f"opts_{lc}") or ()) for lc in LANGS}
+            if not opts["fr"] or len(opts["fr"]) != len(opts["ar"]): errors.append(f"{qid} : options fr/ar absentes ou de tailles différentes")
+            elif q.get("type") == "radio_autre" and opts["fr"][-1] != "Autre": errors.append(f"{qid} : la dernière option d'un radio_autre doit être 'Autre'")
+            options[qid] = MappingProxyType(opts)
+            option_index[qid] = MappingProxyType({lc: MappingProxyType({o: k for k, o in enumerate(opts[lc])}) for lc in LANGS})
+    jumps = {}
+    for q in questions:
+        saut = q.get("saut")
+        if not saut: continue
+        target = index_of.get(saut.get("vers"))
+        if target is None or target <= index_of[q["id"]]: errors.append(f"{q['id']} : saut vers '{saut.get('vers')}' inconnu ou en arrière")
+        all_opts = set(options.get(q["id"], {}).get("fr", ())) | set(options.get(q["id"], {}).get("ar", ()))
+        for v in saut.get("si", []):
+            if v not in all_opts: errors.append(f"{q['id']} : valeur de saut '{v}' absente des options")
+        jumps[q["id"]] = (frozenset(saut.get("si", [])), target)
+    loop = doc.get("boucle_enfants") or {}
+    child_trigger, child_after = loop.get("declencheur"), index_of.get(loop.get("suite"))
+    if child_trigger is not None:
+        if child_trigger not in index_of or questions[index_of[child_trigger]].get("type") != "number":
+            errors.append(f"Boucle enfants : '{child_trigger}' doit être une question de type number")
+        if child_after is None: errors.append(f"Boucle enfants : question de suite '{loop.get('suite')}' inconnue")
+        for field in CHILD_CHOICE_FIELDS:
+            by_lang = (doc.get("enfants") or {}).get(field) or {}
+            if any(len(by_lang.get(lc) or ()) < 2 for lc in LANGS): errors.append(f"Boucle enfants : au moins 2 options '{field}' requises en fr et ar")
+    child_options, child_option_index = {}, {}
+    for field, by_lang in (doc.get("enfants") or {}).items():
+        if field not in CHILD_FIELDS: errors.append(f"Enfants : champ inconnu '{field}'")
+        if any(not by_lang.get(lc) for lc in LANGS): errors.append(f"Enfants : options '{field}' manquantes")
+        child_options[field] = MappingProxyType({lc: tuple(by_lang.get(lc) or ()) for lc in LANGS})
+        child_option_index[field] = MappingProxyType({lc: MappingProxyType({o: k for k, o in enumerate(child_options[field][lc])}) for lc in LANGS})
+    # Champs conditionnels : une valeur déclenchante absente des options éteindrait le champ sans bruit
+    child_conditions = {}
+    conditions = loop.get("conditions") or {}
+    for field in conditions:
+        if field not in CHILD_CONDITIONAL_FIELDS: errors.append(f"Boucle enfants : champ conditionnel inconnu '{field}'")
+    for field, source in CHILD_CONDITIONAL_FIELDS.items():
+        cond = conditions.get(field)
+        if not cond:
+            if child_trigger is not None: errors.append(f"Boucle enfants : condition '{field}' manquante")
+            continue
+        if cond.get("champ") != source: errors.append(f"Boucle enfants : '{field}' dépend de '{source}', pas de '{cond.get('champ')}'")
+        all_opts = set(child_options.get(source, {}).get("fr", ())) | set(child_options.get(source, {}).get("ar", ()))
+        if not cond.get("si"): errors.append(f"Boucle enfants : aucune valeur déclenchant '{field}'")
+        for v in cond.get("si") or []:
+            if v not in all_opts: errors.append(f"Boucle enfants : valeur '{v}' déclenchant '{field}' absente des options '{source}'")
+        child_conditions[field] = frozenset(cond.get("si") or ())
+    if errors: raise ValueError("\n".join(errors))
+    return Survey(doc.get("titre", ""), tuple(MappingProxyType(dict(q)) for q in questions), MappingProxyType(index_of),
+                  MappingProxyType(options), MappingProxyType(option_index), MappingProxyType(jumps),
+                  child_trigger, questions[index_of[child_trigger]]["key"] if child_trigger else None, child_after, MappingProxyType(child_options), MappingProxyType(child_option_index),
+                  MappingProxyType(child_conditions))
+
+def load_survey(path):
+    with open(path, encoding="utf-8") as f: return compile_survey(json.load(f))
+
+@st.cache_resource
+def get_survey(path=SURVEY_FILE):
+    return load_survey(path)
+
+def jump_target(survey, qid, value):
+    jump = survey.jumps.get(qid)
+    if jump and value in jump[0]: return jump[1]
+    return None
+
+
+# --- ENFANT (ENREGISTREMENT COMPACT) ---
+# Un objet à __slots__ par enfant (pas de dict par instance). get() garde la lecture "à la dict"
+# du formatage des lignes, qui reçoit aussi les enfants du panier (dicts relus du JSON).
+class Child:
+    __slots__ = tuple(CHILD_FIELDS)
+
+    def __init__(self, **values):
+        for f in CHILD_FIELDS: setattr(self, f, values.get(f, ""))
+
+    def get(self, field, default=""):
+        return getattr(self, field, default)
+
+    def as_dict(self):
+        return {f: getattr(self, f) for f in CHILD_FIELDS}
+
+    # Le script est réexécuté à chaque rerun : un Child d'un rerun précédent n'est pas une instance
+    # de la classe courante, d'où le test sur dict plutôt que sur Child
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values) if isinstance(values, dict) else values
+
+# --- TACHES DE FOND (EXECUTEUR BORNE) ---
+# Petit pool partagé par le processus pour le travail qui ne doit pas bloquer l'écran (gTTS).
+# Au plus BACKGROUND_WORKERS en cours + BACKGROUND_BACKLOG en attente ; au-delà submit() refuse
+# au lieu d'empiler. Une même clé n'est soumise qu'une fois tant qu'elle n'est pas terminée.
+class BackgroundTasks:
+    def __init__(self, workers, backlog):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="taches-fond")
+        self.slots = threading.BoundedSemaphore(workers + backlog)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.last_error = None
+
+    def submit(self, key, fn, *args):
+        with self.lock:
+            if key in self.pending: return True
+            if not self.slots.acquire(blocking=False): return False
+            self.pending.add(key)
+        self.pool.submit(fn, *args).add_done_callback(lambda f: self._done(key, f))
+        return True
+
+    def _done(self, key, future):
+        with self.lock: self.pending.discard(key)
+        self.slots.release()
+        if future.exception(): self.last_error = str(future.exception())
+
+@st.cache_resource
+def get_background_tasks():
+    return BackgroundTasks(BACKGROUND_WORKERS, BACKGROUND_BACKLOG)
+
+# --- CACHE AUDIO (TTS) ---
+# Les MP3 sont stockés sur disque par hash de (langue, texte) et gardés en mémoire (LRU borné).
+# gTTS n'est appelé qu'en cas d'absence (miss).
+
+class AudioCache:
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.mem = OrderedDict()
+        self.mem_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def path_for(self, text, lang):
+        h = hashlib.sha256(f"{lang}\n{text}".encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, h[:2], h + ".mp3")
+
+    def _remember(self, key, data):
+        with self.lock:
+            if key in self.mem: return
+            self.mem[key] = data
+            self.mem_bytes += len(data)
+            while self.mem_bytes > self.max_bytes and len(self.mem) > 1:
+                _, old = self.mem.popitem(last=False)
+                self.mem_bytes -= len(old)
+                self.evictions += 1
+
+    def render(self, text, lang):
+        from gtts import gTTS
+        with trace("gtts", langue=lang) as sp:
+            tts = gTTS(text, lang=lang)
+            fp = io.BytesIO()
+            tts.write_to_fp(fp)
+            if sp: sp.set(octets=fp.tell())
+        return fp.getvalue()
+
+    # Mémoire puis disque, sans jamais appeler gTTS : None si l'audio n'existe pas encore
+    def peek(self, text, lang):
+        key = (text, lang)
+        with self.lock:
+            data = self.mem.get(key)
+            if data is not None:
+                self.mem.move_to_end(key)
+                self.hits += 1
+                return data
+        path = self.path_for(text, lang)
+        if not os.path.exists(path): return None
+        with open(path, "rb") as f: data = f.read()
+        with self.lock: self.hits += 1
+        self._remember(key, data)
+        return data
+
+    def get(self, text, lang):
+        data = self.peek(text, lang)
+        if data is not None: return data
+        path = self.path_for(text, lang)
+        data = self.render(text, lang)
+        with self.lock: self.misses += 1
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f: f.write(data)
+        os.replace(tmp, path)
+        self._remember((text, lang), data)
+        return data
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self.mem), "bytes": self.mem_bytes}
+
+@st.cache_resource
+def get_audio_cache():
+    return AudioCache(AUDIO_DIR, AUDIO_CACHE_MAX_BYTES)
+
+def child_intro_text(idx, lc):
+    return f"Informations pour l'enfant {idx + 1}" if lc == "fr" else f"معلومات الطفل {idx + 1}"
+
+def audio_prompts():
+    prompts = []
+    for lc in ["fr", "ar"]:
+        for q in get_survey().questions: prompts.append((q[lc], lc))
+        for i in range(MAX_ENFANTS_PREVISION): prompts.append((child_intro_text(i, lc), lc))
+        prompts.append((SUCCESS_MSG, lc))
+    return prompts
+
+def warm_audio_cache():
+    cache = get_audio_cache()
+    errors = []
+    for text, lang in audio_prompts():
+        try: cache.get(text, lang)
+        except Exception as e: errors.append((text, lang, str(e)))
+    return cache.stats(), errors
+
+# --- CONNEXION GOOGLE SHEETS (PARTAGEE ENTRE SESSIONS) ---
+# Une seule authentification par processus. Le jeton est rafraîchi automatiquement
+# par la session gspread ; en cas d'erreur d'auth on se reconnecte et on rejoue l'appel.
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+def _is_auth_error(e):
+    resp = getattr(e, "response", None)
+    if resp is not None and getattr(resp, "status_code", None) in (401, 403): return True
+    return type(e).__name__ in ("RefreshError", "AccessTokenRefreshError")
+
+def main_sheet():
+    return HOUSEHOLD_SHEET if STORAGE_MODE == "long" else None
+
+class SheetPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.book = None
+        self.sheets = {}
+        self.headers_ok = set()
+        self.reconnects = 0
+
+    def _credentials(self):
+        from oauth2client.service_account import ServiceAccountCredentials
+        try: has_secret = "gcp_service_account" in st.secrets
+        except Exception: has_secret = False
+        if has_secret: return ServiceAccountCredentials.from_json_keyfile_dict(st.secrets["gcp_service_account"], SCOPE)
+        if os.path.exists(CREDENTIALS_FILE): return ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, SCOPE)
+        raise RuntimeError("Erreur Auth")
+
+    # name=None : premier onglet (stockage large), sinon onglet nommé, créé au besoin
+    def get(self, name=None):
+        import gspread
+        with self.lock:
+            if self.book is None:
+                with trace("auth"):
+                    client = gspread.authorize(self._credentials(), http_client=gspread.BackOffHTTPClient)
+                    self.book = client.open(SHEET_NAME)
+            if name not in self.sheets:
+                if name is None: self.sheets[name] = self.book.sheet1
+                else:
+                    try: self.sheets[name] = self.book.worksheet(name)
+                    except gspread.exceptions.WorksheetNotFound:
+                        self.sheets[name] = self.book.add_worksheet(name, rows=1000, cols=len(sheet_headers(name)))
+            return self.sheets[name]
+
+    def reset(self):
+        with self.lock:
+            self.book = None
+            self.sheets = {}
+            self.headers_ok = set()
+            self.reconnects += 1
+
+    def run(self, op, name=None):
+        sheet = self.get(name)
+        try: return op(sheet)
+        except Exception as e:
+            if not _is_auth_error(e): raise
+            self.reset()
+            return op(self.get(name))
+
+    def ensure_headers(self, name=None):
+        if name in self.headers_ok: return
+        def check(sheet):
+            existing = sheet.row_values(1)
+            expected = sheet_headers(name)
+            if not existing: sheet.append_row(expected)
+            # Anciennes feuilles : on complète l'en-tête avec les nouvelles colonnes de fin
+            # (la grille d'une feuille remplie par append_row s'arrête à sa dernière colonne : on l'élargit avant)
+            elif existing != expected and expected[:len(existing)] == existing:
+                if sheet.col_count < len(expected): sheet.add_cols(len(expected) - sheet.col_count)
+                sheet.update(range_name="A1", values=[expected])
+            # Questionnaire réordonné ou modifié : les lignes tomberaient sous les mauvaises colonnes
+            elif existing[:len(expected)] != expected:
+                diff = next(k for k in range(len(expected)) if k >= len(existing) or existing[k] != expected[k])
+                raise RuntimeError(f"En-tête de '{sheet.title}' incompatible avec le questionnaire (colonne {diff + 1} : '{existing[diff] if diff < len(existing) else ''}' au lieu de '{expected[diff]}')")
+        self.run(check, name)
+        self.headers_ok.add(name)
+
+@st.cache_resource
+def get_sheet_pool():
+    return SheetPool()
+
+# --- INDEX LOCAL DE RECHERCHE ---
+# Copie locale des lignes du sheet (réplique SQLite + index en mémoire). La recherche se fait
+# en mémoire par préfixes (mots courts) et trigrammes (sous-chaînes), sans accents ni voyelles arabes.
+_AR_FOLD = str.maketrans({"ى": "ي", "ة": "ه", "ـ": "", "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+                          "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9"})
+
+def normalize_text(value):
+    t = unicodedata.normalize("NFKD", str(value)).lower()
+    t = "".join(c for c in t if not unicodedata.combining(c)).translate(_AR_FOLD)
+    return " ".join(re.findall(r"\w+", t))
+
+def normalize_digits(value):
+    return re.sub(r"\D", "", normalize_text(value))
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+# --- DETECTION DE DOUBLONS ---
+# Blocage par clés normalisées : CNI, 8 derniers chiffres du Tel, squelette du nom
+# (chef + famille sans voyelles ni lettres doublées, mots triés) et case GPS arrondie
+# (~100 m, cases voisines incluses). Seuls les ménages partageant une clé sont notés.
+
+def _name_key(row):
+    words = normalize_text(f"{row.get('ChefFamille', '')} {row.get('NomFamille', '')}").split()
+    skel = sorted(re.sub(r"(.)\1+", r"\1", re.sub(r"[aeiouy]", "", w)) for w in words)
+    return " ".join(w for w in skel if w)
+
+def _gps_cell(row):
+    try: return round(float(str(row.get("Lat", "")).replace(",", ".")), DUP_GPS_DECIMALS), round(float(str(row.get("Long", "")).replace(",", ".")), DUP_GPS_DECIMALS)
+    except ValueError: return None
+
+def duplicate_keys(row):
+    keys = set()
+    cni = normalize_digits(row.get("CNI", ""))
+    if len(cni) >= 4: keys.add("cni:" + cni)
+    tel = normalize_digits(row.get("Tel", ""))
+    if len(tel) >= 6: keys.add("tel:" + tel[-8:])
+    name = _name_key(row)
+    if name: keys.add("nom:" + name)
+    cell = _gps_cell(row)
+    if cell: keys.add(f"geo:{cell[0]}:{cell[1]}")
+    return keys
+
+def _neighbour_keys(row):
+    keys = duplicate_keys(row)
+    cell = _gps_cell(row)
+    if cell:
+        step = 10 ** -DUP_GPS_DECIMALS
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1): keys.add(f"geo:{round(cell[0] + dx * step, DUP_GPS_DECIMALS)}:{round(cell[1] + dy * step, DUP_GPS_DECIMALS)}")
+    return keys
+
+def duplicate_score(a, b):
+    score = 0
+    cni_a, cni_b = normalize_digits(a.get("CNI", "")), normalize_digits(b.get("CNI", ""))
+    if cni_a and cni_a == cni_b: score += 0.7
+    tel_a, tel_b = normalize_digits(a.get("Tel", ""))[-8:], normalize_digits(b.get("Tel", ""))[-8:]
+    if len(tel_a) >= 6 and tel_a == tel_b: score += 0.4
+    name_a = normalize_text(f"{a.get('ChefFamille', '')} {a.get('NomFamille', '')}")
+    name_b = normalize_text(f"{b.get('ChefFamille', '')} {b.get('NomFamille', '')}")
+    if name_a and name_b: score += 0.5 * difflib.SequenceMatcher(None, name_a, name_b).ratio()
+    cell_a, cell_b = _gps_cell(a), _gps_cell(b)
+    if cell_a and cell_b and abs(cell_a[0] - cell_b[0]) < 0.0015 and abs(cell_a[1] - cell_b[1]) < 0.0015: score += 0.2
+    return min(score, 1.0)
+
+# --- REPLIQUE LOCALE (SYNCHRO PAR DELTA) ---
+# Chaque onglet est recopié dans replique.db : une ligne SQLite par ligne du sheet, avec sa
+# signature (colonnes de contrôle, ex. ID_Menage + Version) et un numéro de séquence. Un thread
+# de fond interroge le sheet toutes les REPLICA_POLL_SECONDS en un seul batch_get :
+#   - les lignes après le watermark (ajouts),
+#   - les seules colonnes de contrôle des lignes déjà connues,
+#   - un bloc tournant de REPLICA_BLOCK lignes complètes.
+# Les signatures sont comparées par blocs de REPLICA_BLOCK lignes (empreinte du bloc), et seules
+# les lignes modifiées des blocs différents sont relues en entier. Le bloc tournant rattrape ce que
+# les signatures ne voient pas (correction à la main sans changer Version, lignes sans ID_Menage) :
+# son empreinte complète est comparée à celle de la réplique, et le bloc suivant est relu à la
+# synchro d'après, jusqu'à revenir au début du sheet. Recherche, CHARGER et tableau de bord lisent
+# la réplique : aucun appel Sheets par action dans le cas courant.
+class ReplicaStore:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        with closing(self._conn()) as c, c:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("CREATE TABLE IF NOT EXISTS replica_rows (sheet TEXT, row INTEGER, data TEXT, sig TEXT, seq INTEGER, PRIMARY KEY (sheet, row))")
+            c.execute("CREATE INDEX IF NOT EXISTS replica_rows_seq ON replica_rows (sheet, seq)")
+            c.execute("CREATE TABLE IF NOT EXISTS replica_meta (sheet TEXT PRIMARY KEY, headers TEXT, watermark INTEGER, seq INTEGER, synced REAL)")
+
+    def _conn(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def meta(self, sheet):
+        with closing(self._conn()) as c:
+            r = c.execute("SELECT headers, watermark, seq, synced FROM replica_meta WHERE sheet = ?", (sheet,)).fetchone()
+        return {"headers": json.loads(r[0]), "watermark": r[1], "seq": r[2], "synced": r[3]} if r else None
+
+    def changes(self, sheet, after_seq):
+        with closing(self._conn()) as c:
+            return c.execute("SELECT row, data, sig FROM replica_rows WHERE sheet = ? AND seq > ?", (sheet, after_seq)).fetchall()
+
+    # Lignes non vides d'un onglet dans l'ordre du sheet, par pages (export à mémoire bornée)
+    def pages(self, sheet, page):
+        last = 0
+        while True:
+            with closing(self._conn()) as c:
+                got = c.execute("SELECT row, data FROM replica_rows WHERE sheet = ? AND row > ? AND data IS NOT NULL ORDER BY row LIMIT ?",
+                                (sheet, last, page)).fetchall()
+            if not got: return
+            yield [json.loads(d) for _, d in got]
+            last = got[-1][0]
+
+    # rows : [(numéro de ligne, valeurs ou None si la ligne est vide, signature)] écrits sous une même séquence
+    def save(self, sheet, headers, watermark, rows):
+        with closing(self._conn()) as c:
+            c.isolation_level = None
+            c.execute("BEGIN IMMEDIATE")
+            r = c.execute("SELECT watermark, seq FROM replica_meta WHERE sheet = ?", (sheet,)).fetchone()
+            seq = (r[1] if r else 0) + 1
+            c.executemany("INSERT OR REPLACE INTO replica_rows (sheet, row, data, sig, seq) VALUES (?, ?, ?, ?, ?)",
+                          [(sheet, n, None if v is None else json.dumps(v, ensure_ascii=False), sig, seq) for n, v, sig in rows])
+            c.execute("INSERT OR REPLACE INTO replica_meta (sheet, headers, watermark, seq, synced) VALUES (?, ?, ?, ?, ?)",
+                      (sheet, json.dumps(headers, ensure_ascii=False), max(watermark, r[0] if r else 0), seq, time.time()))
+            c.execute("COMMIT")
+        return seq
+
+@st.cache_resource
+def get_replica_store():
+    return ReplicaStore(REPLICA_PATH)
+
+def _block_hash(sigs):
+    return hashlib.blake2b("\n".join(sigs).encode("utf-8"), digest_size=8).hexdigest()
+
+def _trim_row(values):
+    values = list(values)
+    while values and values[-1] == "": values.pop()
+    return values
+
+def _row_runs(rows):
+    runs = []
+    for r in sorted(rows):
+        if runs and r == runs[-1][1] + 1: runs[-1][1] = r
+        else: runs.append([r, r])
+    return runs
+
+class SheetMirror:
+    check_columns = ("ID_Menage", "Version")
+
+    def __init__(self, name=None, replica=None):
+        self.name = name
+        self.key = name or "sheet1"
+        self.replica = replica
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.stale = threading.Event()
+        self.dirty = False
+        self.headers = []
+        self.watermark = 1
+        self.last_sync = 0
+        self.seq = 0
+        self.rows = {}
+        self.sigs = {}
+        self.block_hashes = {}
+        self.local = {}
+        self.scan_next = 2
+
+    def upsert(self, row_num, row):
+        with self.lock: self.rows[row_num] = row
+
+    # Mise à jour en mémoire seulement (ex. mise à jour envoyée par ce serveur) : la réplique la
+    # recevra du sheet à la prochaine synchro, sa signature ayant changé (Version + 1). D'ici là, le
+    # bloc tournant ne la remplace pas par l'ancienne valeur distante (au plus REPLICA_OVERLAY_SECONDS).
+    def overlay(self, row_num, row):
+        self.local[row_num] = time.time()
+        self.upsert(row_num, row)
+
+    def remove(self, row_num):
+        with self.lock: self.rows.pop(row_num, None)
+
+    def mark_stale(self):
+        self.dirty = True
+        self.stale.set()
+
+    def _check_idx(self):
+        return [self.headers.index(c) for c in self.check_columns if c in self.headers]
+
+    def _sig(self, values, idx):
+        return "\x1f".join(str(values[i]) if i < len(values) else "" for i in idx)
+
+    def _apply(self, changes):
+        for row_num, values, sig in changes:
+            self.sigs[row_num] = sig
+            self.local.pop(row_num, None)
+            self.block_hashes.pop((row_num - 2) // REPLICA_BLOCK, None)
+            padded = (values or []) + [""] * (len(self.headers) - len(values or []))
+            if any(padded): self.upsert(row_num, dict(zip(self.headers, padded)))
+            elif row_num in self.rows: self.remove(row_num)
+
+    # Rattrapage depuis la réplique SQLite (écrite par ce processus ou un autre) : aucun appel Sheets
+    def catch_up(self):
+        if not self.replica: return 0
+        # Synchro en cours dans un autre thread : on lit l'état mémoire actuel plutôt que d'attendre le réseau
+        if not self.sync_lock.acquire(blocking=not self.seq): return 0
+        try:
+            meta = self.replica.meta(self.key)
+            if not meta or meta["seq"] <= self.seq: return 0
+            changed = self.replica.changes(self.key, self.seq)
+            self.headers = meta["headers"]
+            self._apply([(n, None if d is None else json.loads(d), sig) for n, d, sig in changed])
+            self.watermark = max(self.watermark, meta["watermark"])
+            self.seq = meta["seq"]
+            self.last_sync = max(self.last_sync, meta["synced"])
+            return len(changed)
+        finally: self.sync_lock.release()
+
+    def _local_block_hash(self, block, rows, empty):
+        if block not in self.block_hashes: self.block_hashes[block] = _block_hash([self.sigs.get(r, empty) for r in rows])
+        return self.block_hashes[block]
+
+    # Lignes connues dont la signature distante diffère : comparaison par blocs, puis ligne à ligne
+    def _edited_rows(self, narrow, idx):
+        n = self.watermark - 1
+        empty = self._sig([], idx)
+        cols = [[(r[0] if r else "") for r in col] + [""] * (n - len(col)) for col in narrow]
+        remote = ["\x1f".join(v) for v in zip(*cols)]
+        edited = []
+        for start in range(0, n, REPLICA_BLOCK):
+            block = remote[start:start + REPLICA_BLOCK]
+            rows = range(start + 2, start + 2 + len(block))
+            if _block_hash(block) == self._local_block_hash(start // REPLICA_BLOCK, rows, empty): continue
+            edited += [r for r, sig in zip(rows, block) if self.sigs.get(r, empty) != sig]
+        return edited
+
+    # Relecture complète de lignes précises (plages contiguës regroupées en un seul batch_get)
+    def _fetch_rows(self, pool, rows, last_col, idx):
+        runs = _row_runs(rows)
+        with trace("sheets.lecture", onglet=self.key, lignes=len(rows)) as sp:
+            got = pool.run(lambda sh: sh.batch_get([f"A{a}:{last_col}{b}" for a, b in runs]), self.name)
+            if sp: sp.set(octets=_payload_bytes(got))
+        changes = []
+        for (a, b), values in zip(runs, got):
+            for r in range(a, b + 1):
+                v = values[r - a] if r - a < len(values) else []
+                changes.append((r, v if any(v) else None, self._sig(v, idx)))
+        return changes
+
+    def _values(self, row_num):
+        row = self.rows.get(row_num) or {}
+        return _trim_row([str(row.get(h, "")) for h in self.headers])
+
+    # Bloc tournant : lignes complètes comparées par empreinte, puis ligne à ligne si elle diffère
+    def _scan(self, rows, values, skip, idx):
+        remote = [_trim_row([str(v) for v in values[k]]) if k < len(values) else [] for k in range(len(rows))]
+        local = [self._values(r) for r in rows]
+        pack = lambda block: ["\x1f".join(v) for v in block]
+        if _block_hash(pack(remote)) == _block_hash(pack(local)): return []
+        changes, now = [], time.time()
+        for r, rv, lv in zip(rows, remote, local):
+            if rv == lv: self.local.pop(r, None)
+            elif r not in skip and now - self.local.get(r, 0) > REPLICA_OVERLAY_SECONDS:
+                changes.append((r, rv if any(rv) else None, self._sig(rv, idx)))
+        return changes
+
+    def _scan_rows(self, first):
+        return range(first, min(first + REPLICA_BLOCK - 1, self.watermark) + 1)
+
+    def _persist(self, changes):
+        if not self.replica: return
+        seq = self.replica.save(self.key, self.headers, self.watermark, changes)
+        # Une autre instance a écrit entre-temps : catch_up rejouera ses lignes (opération idempotente)
+        if seq == self.seq + 1: self.seq = seq
+
+    # Synchro par delta ; renvoie les lignes existantes modifiées dans le sheet (hors ajouts)
+    def refresh(self, pool, force=False):
+        self.catch_up()
+        if not force and not self.dirty and time.time() - self.last_sync < REPLICA_POLL_SECONDS: return []
+        with self.sync_lock:
+            self.dirty = False
+            # En-têtes + nouvelles lignes + colonnes de contrôle des lignes connues, en un seul appel
+            width = max(len(self.headers), len(sheet_headers(self.name)))
+            last_col = _col_letters(width)
+            known = self._check_idx() if self.watermark > 1 else []
+            ranges = ["1:1", f"A{self.watermark + 1}:{last_col}"]
+            ranges += [f"{_col_letters(i + 1)}2:{_col_letters(i + 1)}{self.watermark}" for i in known]
+            if self.scan_next > self.watermark: self.scan_next = 2
+            scan = self._scan_rows(self.scan_next) if self.watermark > 1 else None
+            if scan: ranges.append(f"A{scan.start}:{last_col}{scan.stop - 1}")
+            with trace("sheets.lecture", onglet=self.key) as sp:
+                got = pool.run(lambda sh: sh.batch_get(ranges), self.name)
+                if sp: sp.set(lignes=len(got[1]), octets=_payload_bytes(got))
+            head, values, narrow = got[0], got[1], got[2:2 + len(known)]
+            headers = list(head[0]) if head else []
+            if not headers: return []
+            self.headers = headers
+            edited = self._edited_rows(narrow, known) if known else []
+            idx = self._check_idx()
+            changes = self._fetch_rows(pool, edited, last_col, idx) if edited else []
+            if scan:
+                changes += self._scan(scan, got[-1], {c[0] for c in changes}, idx)
+                self.scan_next = scan.stop
+            start = self.watermark + 1
+            changes += [(start + k, v if any(v) else None, self._sig(v, idx)) for k, v in enumerate(values)]
+            self._apply(changes)
+            self.watermark += len(values)
+            if changes or not self.last_sync: self._persist(changes)
+            self.last_sync = time.time()
+            return [self.rows[r] for r in edited if r in self.rows]
+
+    # Relecture forcée de lignes connues (ex. enfants d'un ménage modifié dans le sheet)
+    def refetch(self, pool, rows):
+        if not rows or not self.headers: return 0
+        with self.sync_lock:
+            changes = self._fetch_rows(pool, rows, _col_letters(len(self.headers)), self._check_idx())
+            self._apply(changes)
+            self._persist(changes)
+            return len(changes)
+
+class HouseholdIndex(SheetMirror):
+    def __init__(self, name=None, replica=None):
+        super().__init__(name, replica)
+        self.texts = {}
+        self.prefixes = {}
+        self.grams = {}
+        self.blocks = {}
+        self.block_keys = {}
+        self.sync = None
+
+    def _row_text(self, row):
+        parts = []
+        for f in SEARCH_FIELDS:
+            v = row.get(f, "")
+            parts.append(normalize_digits(v) if f in ("Tel", "CNI") else normalize_text(v))
+        return " ".join(p for p in parts if p)
+
+    def _unindex(self, row_num):
+        for tok in self.texts.pop(row_num, "").split():
+            for k in range(1, len(tok) + 1): self.prefixes.get(tok[:k], set()).discard(row_num)
+            for g in _trigrams(tok): self.grams.get(g, set()).discard(row_num)
+        for key in self.block_keys.pop(row_num, ()): self.blocks.get(key, set()).discard(row_num)
+
+    def upsert(self, row_num, row):
+        with self.lock:
+            self._unindex(row_num)
+            text = self._row_text(row)
+            self.rows[row_num] = row
+            self.texts[row_num] = text
+            for tok in set(text.split()):
+                for k in range(1, len(tok) + 1): self.prefixes.setdefault(tok[:k], set()).add(row_num)
+                for g in _trigrams(tok): self.grams.setdefault(g, set()).add(row_num)
+            self.block_keys[row_num] = duplicate_keys(row)
+            for key in self.block_keys[row_num]: self.blocks.setdefault(key, set()).add(row_num)
+
+    def remove(self, row_num):
+        with self.lock:
+            self._unindex(row_num)
+            self.rows.pop(row_num, None)
+
+    def find_duplicates(self, data, threshold=DUP_THRESHOLD):
+        with self.lock:
+            candidates = set()
+            for key in _neighbour_keys(data): candidates |= self.blocks.get(key, set())
+            scored = [(duplicate_score(data, self.rows[r]), r, self.rows[r]) for r in candidates]
+        return sorted([d for d in scored if d[0] >= threshold], key=lambda d: -d[0])
+
+    def search(self, term):
+        tokens = normalize_text(term).split()
+        if not tokens: return []
+        if all(t.isdigit() for t in tokens): tokens = ["".join(tokens)]
+        with self.lock:
+            found = None
+            for tok in tokens:
+                if len(tok) < 3: hits = set(self.prefixes.get(tok, ()))
+                else:
+                    grams = [self.grams.get(g, set()) for g in _trigrams(tok)]
+                    hits = set.intersection(*grams) if all(grams) else set()
+                    hits = {r for r in hits if tok in self.texts[r]}
+                found = hits if found is None else found & hits
+                if not found: return []
+            return [(r, self.rows[r]) for r in sorted(found)]
+
+class ChildStore(SheetMirror):
+    check_columns = ("ID_Menage", "Rang")
+
+    def __init__(self, name=CHILD_SHEET, replica=None):
+        super().__init__(name, replica)
+        self.by_household = {}
+
+    def upsert(self, row_num, row):
+        with self.lock:
+            old = self.rows.get(row_num)
+            if old: self.by_household.get(old.get("ID_Menage"), set()).discard(row_num)
+            self.rows[row_num] = row
+            if row.get("ID_Menage"): self.by_household.setdefault(row["ID_Menage"], set()).add(row_num)
+
+    def remove(self, row_num):
+        with self.lock:
+            old = self.rows.pop(row_num, None)
+            if old: self.by_household.get(old.get("ID_Menage"), set()).discard(row_num)
+
+    def rows_for(self, household_id):
+        with self.lock:
+            nums = self.by_household.get(household_id, set())
+            return sorted(nums, key=lambda r: (int(self.rows[r].get("Rang") or 0), r))
+
+    def children_of(self, household_id):
+        return [Child(**self.rows[r]) for r in self.rows_for(household_id)]
+
+    # Lignes d'un ménage et leurs valeurs au chargement : base des mises à jour de ses enfants
+    def snapshot(self, household_id):
+        nums = self.rows_for(household_id)
+        with self.lock: return nums, [[str((self.rows.get(r) or {}).get(h, "")) for h in child_headers()] for r in nums]
+
+# Chargement de la réplique en mémoire différé (thread de synchro, ou première recherche) :
+# il ne retarde pas le premier rendu
+@st.cache_resource
+def get_search_index():
+    return HouseholdIndex(main_sheet(), get_replica_store())
+
+@st.cache_resource
+def get_child_store():
+    return ChildStore(replica=get_replica_store())
+
+# Thread "sync-replique" : rattrapage depuis le disque puis synchro immédiate, ensuite toutes les
+# REPLICA_POLL_SECONDS ou dès qu'un envoi a abouti (mark_stale). Les enfants d'un ménage dont la
+# Version a changé dans le sheet sont relus, leurs colonnes de contrôle (ID_Menage, Rang) ne bougeant pas.
+class ReplicaSync:
+    def __init__(self, pool, index, children):
+        self.pool = pool
+        self.index = index
+        self.children = children
+        self.last_ms = None
+        self.last_error = None
+        # Au démarrage, la réplique sur disque peut dater : première synchro forcée
+        index.mark_stale()
+        children.mark_stale()
+        index.sync = self
+        threading.Thread(target=self._loop, daemon=True, name="sync-replique").start()
+
+    def sync(self):
+        t0 = time.time()
+        with trace("replique.synchro"):
+            edited = self.index.refresh(self.pool)
+            if STORAGE_MODE == "long":
+                self.children.refresh(self.pool)
+                ids = {r.get("ID_Menage") for r in edited if r.get("ID_Menage")}
+                self.children.refetch(self.pool, set().union(*(self.children.rows_for(i) for i in ids)) if ids else ())
+        self.last_ms = (time.time() - t0) * 1000
+
+    def _loop(self):
+        while True:
+            try:
+                self.sync()
+                self.last_error = None
+            except Exception as e: self.last_error = str(e)
+            self.index.stale.wait(REPLICA_POLL_SECONDS)
+            self.index.stale.clear()
+
+# Démarré au premier besoin de la réplique (recherche, récapitulatif, tableau de bord) et non au
+# premier affichage : l'import de gspread et l'authentification ne retardent pas l'écran d'accueil
+@st.cache_resource
+def get_replica_sync():
+    return ReplicaSync(get_sheet_pool(), get_search_index(), get_child_store())
+
+# --- FILE D'ENVOI LOCALE (HORS LIGNE D'ABORD) ---
+# Chaque soumission est d'abord écrite dans un journal SQLite (mode WAL) puis acquittée.
+# Un thread de fond vide le journal vers Google Sheets par lots (append_rows / batch_update)
+# avec reprise et backoff exponentiel. La clé d'idempotence d'un ajout est l'ID_Menage :
+# avant de rejouer un lot déjà tenté, on retire les ménages déjà présents dans le sheet.
+
+class SubmissionQueue:
+    def __init__(self, path, pool, index, children):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.pool = pool
+        self.index = index
+        self.children = children
+        self.wake = threading.Event()
+        self.flush_lock = threading.Lock()
+        self.last_flush_ms = None
+        self.last_error = None
+        with closing(self._conn()) as c, c:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("""CREATE TABLE IF NOT EXISTS submissions (
+                id TEXT PRIMARY KEY, kind TEXT, row_idx INTEGER, payload TEXT, status TEXT,
+                attempts INTEGER DEFAULT 0, next_try REAL, created REAL, sent REAL, last_error TEXT)""")
+        threading.Thread(target=self._loop, daemon=True, name="flush-sheets").start()
+
+    def _conn(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def enqueue(self, kind, row, row_idx=None, key=None):
+        key = key or uuid.uuid4().hex
+        now = time.time()
+        with trace("file.ajout", type=kind), closing(self._conn()) as c, c:
+            c.execute("INSERT OR IGNORE INTO submissions (id, kind, row_idx, payload, status, next_try, created) VALUES (?, ?, ?, ?, 'attente', ?, ?)",
+                      (key, kind, row_idx, json.dumps(row, ensure_ascii=False), now, now))
+        self.wake.set()
+        return key
+
+    # Plusieurs soumissions (panier) en une seule transaction : elles partiront dans le même lot
+    def enqueue_many(self, kind, items):
+        now = time.time()
+        with trace("file.ajout", type=kind, soumissions=len(items)), closing(self._conn()) as c, c:
+            c.executemany("INSERT OR IGNORE INTO submissions (id, kind, payload, status, next_try, created) VALUES (?, ?, ?, 'attente', ?, ?)",
+                          [(key, kind, json.dumps(row, ensure_ascii=False), now, now) for key, row in items])
+        self.wake.set()
+        return len(items)
+
+    def stats(self):
+        with closing(self._conn()) as c:
+            depth, oldest = c.execute("SELECT COUNT(*), MIN(created) FROM submissions WHERE status = 'attente'").fetchone()
+        return {"depth": depth, "oldest_age": time.time() - oldest if oldest else 0,
+                "last_flush_ms": self.last_flush_ms, "last_error": self.last_error}
+
+    def _loop(self):
+        while True:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            try: self.flush()
+            except Exception as e: self.last_error = str(e)
+
+    def flush(self):
+        with self.flush_lock:
+            now = time.time()
+            with closing(self._conn()) as c:
+                # Réservation atomique du lot (bail de FLUSH_LEASE s) : deux workers ne prennent jamais les mêmes lignes.
+                # La tentative est comptée AVANT l'envoi : un crash après un ajout réussi déclenchera la vérification de doublon
+                c.isolation_level = None
+                c.execute("BEGIN IMMEDIATE")
+                pending = c.execute("SELECT id, kind, row_idx, payload, attempts FROM submissions WHERE status = 'attente' AND next_try <= ? ORDER BY created LIMIT ?",
+                                    (now, FLUSH_BATCH)).fetchall()
+                c.executemany("UPDATE submissions SET attempts = attempts + 1, next_try = ?, last_error = NULL WHERE id = ?", [(now + FLUSH_LEASE, p[0]) for p in pending])
+                c.execute("COMMIT")
+            if not pending: return 0
+            t0 = time.time()
+            try:
+                appends = [(p[0], self._payload(p[3])) for p in pending if p[1] == "append"]
+                updates = [(p[0], p[2], self._payload(p[3])) for p in pending if p[1] == "update"]
+                with trace("envoi.lot", soumissions=len(pending)):
+                    conflicts = self._send(appends, updates, any(p[4] > 0 for p in pending))
+            except Exception as e:
+                self.last_error = str(e)
+                with closing(self._conn()) as c, c:
+                    for p in pending:
+                        delay = min(FLUSH_MAX_BACKOFF, FLUSH_INTERVAL * 2 ** p[4])
+                        c.execute("UPDATE submissions SET next_try = ?, last_error = ? WHERE id = ?", (time.time() + delay, str(e), p[0]))
+                return 0
+            self.last_flush_ms = (time.time() - t0) * 1000
+            self.last_error = None
+            with closing(self._conn()) as c, c:
+                for p in pending:
+                    if p[0] in conflicts: c.execute("UPDATE submissions SET status = 'conflit', last_error = ? WHERE id = ?", (conflicts[p[0]], p[0]))
+                    else: c.execute("UPDATE submissions SET status = 'envoye', sent = ?, last_error = NULL WHERE id = ?", (time.time(), p[0]))
+            self.index.mark_stale()
+            if STORAGE_MODE == "long": self.children.mark_stale()
+            return len(pending)
+
+    def status(self, ids):
+        if not ids: return {}
+        with closing(self._conn()) as c:
+            rows = c.execute(f"SELECT id, status, attempts, next_try, last_error FROM submissions WHERE id IN ({','.join('?' * len(ids))})", list(ids)).fetchall()
+        return {r[0]: {"id": r[0], "status": r[1], "attempts": r[2], "next_try": r[3] or 0, "last_error": r[4]} for r in rows}
+
+    # Seulement les soumissions en attente après un échec (last_error) : celles réservées par un
+    # envoi en cours ont last_error effacé et gardent leur bail
+    def retry_now(self, ids):
+        with closing(self._conn()) as c, c:
+            c.executemany("UPDATE submissions SET next_try = ? WHERE id = ? AND status = 'attente' AND last_error IS NOT NULL", [(time.time(), i) for i in ids])
+        self.wake.set()
+
+    def conflicts(self):
+        with closing(self._conn()) as c:
+            return c.execute("SELECT id, payload, last_error FROM submissions WHERE status = 'conflit' ORDER BY created DESC LIMIT 20").fetchall()
+
+    def _payload(self, raw):
+        payload = json.loads(raw)
+        return {"row": payload} if isinstance(payload, list) else payload
+
+    def _existing_ids(self, name, col):
+        return set(self.pool.run(lambda sh: sh.col_values(col), name))
+
+    def _send(self, appends, updates, retried):
+        name = main_sheet()
+        self.pool.ensure_headers(name)
+        if STORAGE_MODE == "long": self.pool.ensure_headers(CHILD_SHEET)
+        child_appends = [c for _, p in appends for c in p.get("children", [])]
+        if appends and retried:
+            existing = self._existing_ids(name, sheet_headers(name).index("ID_Menage") + 1)
+            appends = [(k, p) for k, p in appends if k not in existing]
+        if appends:
+            rows = [p["row"] for _, p in appends]
+            with trace("sheets.ajout", lignes=len(rows)) as sp:
+                if sp: sp.set(octets=_payload_bytes(rows))
+                self.pool.run(lambda sh: sh.append_rows(rows), name)
+        applied, conflicts = self._apply_updates(updates, name)
+        if STORAGE_MODE != "long": return conflicts
+        # Enfants : réécriture sur place des lignes fusionnées, ajout des nouvelles
+        rewritten = []
+        for p, (rows, extra, _) in applied:
+            rewritten += rows
+            child_appends += extra
+        if rewritten:
+            self.pool.run(lambda sh: sh.batch_update([{"range": f"A{r}", "values": [v]} for r, v in rewritten]), CHILD_SHEET)
+            for r, v in rewritten: self.children.overlay(r, dict(zip(child_headers(), v)))
+        if child_appends and retried:
+            done = self.pool.run(lambda sh: sh.get_values("A:B"), CHILD_SHEET)
+            done = {(r[0], str(r[1])) for r in done if len(r) > 1}
+            child_appends = [c for c in child_appends if (c[0], str(c[1])) not in done]
+        if child_appends:
+            with trace("sheets.ajout_enfants", lignes=len(child_appends)) as sp:
+                if sp: sp.set(octets=_payload_bytes(child_appends))
+                self.pool.run(lambda sh: sh.append_rows(child_appends), CHILD_SHEET)
+        return conflicts
+
+    # Mise à jour optimiste : la ligne est retrouvée par ID_Menage (l'index de ligne n'est qu'un indice),
+    # seules les cellules modifiées par l'enquêteur sont écrites (un seul batch_update) et la Version
+    # est incrémentée. Si la Version distante a changé, on fusionne quand les cellules modifiées de part
+    # et d'autre sont disjointes, sinon la soumission passe en statut "conflit" (rien n'est écrasé).
+    def _apply_updates(self, updates, name):
+        if not updates: return [], {}
+        layout = sheet_headers(name)
+        id_col, ver_col, date_col = layout.index("ID_Menage"), layout.index("Version"), layout.index("Date_Enquete")
+        ident = [layout.index(f) for f in SEARCH_FIELDS if f in layout]
+        width = len(layout)
+        last_col = _col_letters(width)
+        pad = lambda r: [str(v) for v in r][:width] + [""] * (width - len(r))
+        remote = self.pool.run(lambda sh: sh.batch_get([f"A{r}:{last_col}{r}" for _, r, _ in updates]), name)
+        child_cells = self._child_cells(sorted({r for _, _, p in updates for r in p.get("child_rows", [])})) if STORAGE_MODE == "long" else {}
+        where = {}
+        data, applied, conflicts, latest = [], [], {}, {}
+        for (key, row_idx, p), got in zip(updates, remote):
+            new = pad(p["row"])
+            hid = new[id_col]
+            current = latest[hid][1] if hid in latest else pad(got[0] if got else [])
+            base = pad(p["base"]) if p.get("base") else None
+            # Ligne antérieure aux ID_Menage : l'ID vient d'être attribué, on ne peut pas le chercher.
+            # L'index de ligne fait foi, à condition que la ligne soit toujours celle chargée.
+            legacy = base is not None and not base[id_col]
+            if hid in latest: row_idx = latest[hid][0]
+            elif legacy and current[id_col] != hid:
+                if current[id_col] or any(current[k] != base[k] for k in ident):
+                    conflicts[key] = f"Ligne {row_idx} modifiée ou déplacée depuis le chargement"
+                    continue
+            elif hid and current[id_col] != hid:
+                cell = self.pool.run(lambda sh: sh.find(hid, in_column=id_col + 1), name)
+                if cell is None:
+                    conflicts[key] = f"Ménage {hid} introuvable dans le sheet"
+                    continue
+                row_idx = cell.row
+                current = pad(self.pool.run(lambda sh: sh.row_values(row_idx), name))
+            child_rows = self._child_rows(p, child_cells, where) if STORAGE_MODE == "long" else []
+            if child_rows is None:
+                conflicts[key] = f"Enfants du ménage {hid} déplacés ou supprimés dans l'onglet {CHILD_SHEET}"
+                continue
+            kids = self._merge_children(p, child_rows, child_cells) if STORAGE_MODE == "long" else ([], [], [])
+            if kids[2]:
+                conflicts[key] = "Modifié entre-temps par un autre enquêteur : " + ", ".join(kids[2])
+                continue
+            base = base or current
+            base_fmt = pad(p["base_fmt"]) if p.get("base_fmt") else base
+            ignore = {date_col, ver_col}
+            mine = {k for k in range(width) if new[k] != base_fmt[k] and k not in ignore}
+            # Reprise d'une mise à jour déjà écrite en entier : rien à réécrire. Les enfants comptent :
+            # une même Version avec des enfants encore à écrire est la mise à jour d'un autre enquêteur.
+            if current[ver_col] == str(new[ver_col]) and all(current[k] == new[k] for k in mine) and not kids[0] and not kids[1]:
+                latest[hid] = (row_idx, current)
+                applied.append((p, kids))
+                continue
+            if legacy or _version(current[ver_col]) != _version(base[ver_col]):
+                theirs = {k for k in range(width) if current[k] != base[k] and k not in ignore}
+                # Même valeur des deux côtés (dont une reprise partiellement écrite) : pas de conflit
+                clash = {k for k in mine & theirs if current[k] != new[k]}
+                if clash:
+                    conflicts[key] = "Modifié entre-temps par un autre enquêteur : " + ", ".join(layout[k] for k in sorted(clash))
+                    continue
+            merged = list(current)
+            for k in mine | {date_col}: merged[k] = new[k]
+            merged[ver_col] = str(_version(current[ver_col]) + 1)
+            data += _cell_ranges(row_idx, [k for k in range(width) if merged[k] != current[k]], merged)
+            latest[hid] = (row_idx, merged)
+            applied.append((p, kids))
+            for r, v in kids[0]: child_cells[r] = v
+            self.index.overlay(row_idx, dict(zip(layout, merged)))
+        if data:
+            with trace("sheets.maj", lignes=len(applied), plages=len(data)) as sp:
+                if sp: sp.set(octets=_payload_bytes(data))
+                self.pool.run(lambda sh: sh.batch_update(data), name)
+        return applied, conflicts
+
+    # Lignes enfants complètes (A:L), en un seul batch_get (plages contiguës regroupées)
+    def _child_cells(self, rows):
+        if not rows: return {}
+        runs = _row_runs(rows)
+        last_col = _col_letters(len(child_headers()))
+        got = self.pool.run(lambda sh: sh.batch_get([f"A{a}:{last_col}{b}" for a, b in runs]), CHILD_SHEET)
+        return {r: (values[r - a] if r - a < len(values) else []) for (a, b), values in zip(runs, got) for r in range(a, b + 1)}
+
+    # Lignes enfants d'une mise à jour : celles du chargement si elles portent toujours le même
+    # (ID_Menage, Rang), sinon retrouvées par cette clé dans l'onglet (lignes supprimées ou insérées
+    # à la main, réplique en retard). None si un enfant chargé n'y est plus.
+    def _child_rows(self, p, cells, where):
+        rows = p.get("child_rows", [])
+        keys = [tuple(v[:2]) for v in p.get("child_base") or []]
+        # Soumission mise en file avant cette vérification : lignes du chargement telles quelles
+        if len(keys) != len(rows): return rows
+        if all(tuple((cells.get(r, []) + ["", ""])[:2]) == k for r, k in zip(rows, keys)): return rows
+        if not where:
+            got = self.pool.run(lambda sh: sh.get_values("A:B"), CHILD_SHEET)
+            where.update({(v[0], str(v[1])): n for n, v in enumerate(got, 1) if len(v) > 1})
+        found = [where.get(k) for k in keys]
+        if None in found: return None
+        cells.update(self._child_cells([r for r in found if r not in cells]))
+        return found
+
+    # Enfants : mêmes règles que la ligne ménage, cellule par cellule. mine = ce que l'enquêteur a changé
+    # depuis le chargement (child_base), theirs = ce qui a changé dans l'onglet depuis ; recouvrement
+    # avec des valeurs différentes -> conflit. Renvoie (réécritures [(ligne, valeurs)], ajouts, conflits).
+    def _merge_children(self, p, rows, cells):
+        width = len(child_headers())
+        pad = lambda r: [str(v) for v in r][:width] + [""] * (width - len(r))
+        new = [pad(c) for c in p["children"]]
+        current = [pad(cells.get(r, [])) for r in rows]
+        base = [pad(v) for v in p.get("child_base") or []]
+        # Soumission mise en file avant le relevé des enfants : pas de base, l'onglet fait foi
+        if len(base) != len(rows): base = current
+        rewritten, clash = [], []
+        for i, r in enumerate(rows):
+            target = new[i] if i < len(new) else [""] * width
+            mine = {k for k in range(width) if target[k] != base[i][k]}
+            clash += [f"Enfant {i + 1} {child_headers()[k]}" for k in sorted(mine) if current[i][k] not in (base[i][k], target[k])]
+            merged = list(current[i])
+            for k in mine: merged[k] = target[k]
+            if merged != current[i]: rewritten.append((r, merged))
+        return rewritten, p["children"][len(rows):], clash
+
+def _version(value):
+    try: return int(float(value))
+    except (TypeError, ValueError): return 0
+
+def _cell_ranges(row_num, cols, values):
+    runs = []
+    for k in sorted(cols):
+        if runs and k == runs[-1][-1] + 1: runs[-1].append(k)
+        else: runs.append([k])
+    return [{"range": f"{_col_letters(r[0] + 1)}{row_num}", "values": [[values[k] for k in r]]} for r in runs]
+
+def _col_letters(col):
+    from gspread.utils import rowcol_to_a1
+    return re.sub(r"\d", "", rowcol_to_a1(1, col))
+
+@st.cache_resource
+def get_submission_queue():
+    return SubmissionQueue(JOURNAL_PATH, get_sheet_pool(), get_search_index(), get_child_store())
+
+# --- PHOTOS (COMPRESSION + STOCKAGE ADRESSE PAR CONTENU) ---
+# La photo est réduite (PHOTO_MAX_SIDE) et réencodée en JPEG sous PHOTO_MAX_BYTES, rangée sous
+# photos/<2 premiers car.>/<sha256>.jpg ; le sheet ne reçoit que "sha256:<hash>".
+# Limite : la réduction a lieu sur le serveur, une fois l'image brute de camera_input déjà passée
+# par la liaison 2G/3G de la tablette. Réduire avant l'envoi demanderait un composant personnalisé
+# (canvas côté navigateur) : st.camera_input ne permet pas de choisir la résolution de capture.
+# La copie vers PHOTO_REMOTE_DIR (partage réseau / bucket monté) se fait dans un thread de fond,
+# par blocs, en reprenant un fichier partiel là où il s'était arrêté.
+
+def compress_photo(raw):
+    from PIL import Image, ImageOps
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(raw))).convert("RGB")
+    img.thumbnail((PHOTO_MAX_SIDE, PHOTO_MAX_SIDE))
+    quality = PHOTO_QUALITY
+    while True:
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+        if out.tell() <= PHOTO_MAX_BYTES or quality <= 30: return out.getvalue()
+        quality -= 10
+
+def _photo_relpath(digest):
+    return os.path.join(digest[:2], digest + ".jpg")
+
+class PhotoStore:
+    def __init__(self, folder, remote, journal):
+        self.folder = folder
+        self.remote = remote
+        self.journal = journal
+        self.wake = threading.Event()
+        self.last_error = None
+        os.makedirs(os.path.dirname(journal), exist_ok=True)
+        with closing(self._conn()) as c, c:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("CREATE TABLE IF NOT EXISTS photo_uploads (digest TEXT PRIMARY KEY, status TEXT, attempts INTEGER DEFAULT 0, next_try REAL, created REAL)")
+        if remote: threading.Thread(target=self._loop, daemon=True, name="upload-photos").start()
+
+    def _conn(self):
+        return sqlite3.connect(self.journal, timeout=30)
+
+    def put(self, raw):
+        data = compress_photo(raw)
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.folder, _photo_relpath(digest))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f: f.write(data)
+            os.replace(tmp, path)
+        if self.remote:
+            with closing(self._conn()) as c, c:
+                c.execute("INSERT OR IGNORE INTO photo_uploads (digest, status, next_try, created) VALUES (?, 'attente', 0, ?)", (digest, time.time()))
+            self.wake.set()
+        return f"sha256:{digest}"
+
+    def pending(self):
+        with closing(self._conn()) as c:
+            return c.execute("SELECT COUNT(*) FROM photo_uploads WHERE status = 'attente'").fetchone()[0]
+
+    def _loop(self):
+        while True:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            with closing(self._conn()) as c:
+                todo = c.execute("SELECT digest, attempts FROM photo_uploads WHERE status = 'attente' AND next_try <= ? ORDER BY created",
+                                 (time.time(),)).fetchall()
+            for digest, attempts in todo:
+                try:
+                    self._upload(digest)
+                    status, next_try, self.last_error = "envoye", 0, None
+                except Exception as e:
+                    status, next_try, self.last_error = "attente", time.time() + min(FLUSH_MAX_BACKOFF, FLUSH_INTERVAL * 2 ** attempts), str(e)
+                with closing(self._conn()) as c, c:
+                    c.execute("UPDATE photo_uploads SET status = ?, attempts = attempts + 1, next_try = ? WHERE digest = ?", (status, next_try, digest))
+
+    def _upload(self, digest):
+        src = os.path.join(self.folder, _photo_relpath(digest))
+        dst = os.path.join(self.remote, _photo_relpath(digest))
+        size = os.path.getsize(src)
+        if os.path.exists(dst) and os.path.getsize(dst) == size: return
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        part = dst + ".part"
+        done = os.path.getsize(part) if os.path.exists(part) else 0
+        if done > size: done = 0
+        with open(src, "rb") as fin, open(part, "r+b" if done else "wb") as fout:
+            fin.seek(done)
+            fout.seek(done)
+            fout.truncate()
+            while True:
+                chunk = fin.read(PHOTO_CHUNK)
+                if not chunk: break
+                fout.write(chunk)
+        os.replace(part, dst)
+
+@st.cache_resource
+def get_photo_store():
+    return PhotoStore(PHOTO_DIR, PHOTO_REMOTE_DIR, JOURNAL_PATH)
+
+# --- PANIER DE MENAGES (TOURNEES PORTE A PORTE) ---
+# Les ménages terminés s'accumulent dans un panier propre à l'enquêteur (paramètre ?panier= de l'URL,
+# donc conservé au rechargement de la page), enregistré dans le journal local. Le panier part en une
+# fois : une seule transaction dans la file, donc un seul append_rows. La clé est l'ID_Menage :
+# renvoyer un panier déjà mis en file (coupure entre les deux étapes) ne crée pas de doublon.
+class BasketStore:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        with closing(self._conn()) as c, c:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("CREATE TABLE IF NOT EXISTS panier (basket TEXT, id TEXT, data TEXT, children TEXT, updated REAL, PRIMARY KEY (basket, id))")
+
+    def _conn(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def put(self, basket, data, children):
+        with closing(self._conn()) as c, c:
+            c.execute("INSERT OR REPLACE INTO panier (basket, id, data, children, updated) VALUES (?, ?, ?, ?, ?)",
+                      (basket, data["ID_Menage"], json.dumps(data, ensure_ascii=False), json.dumps(children, ensure_ascii=False), time.time()))
+
+    def items(self, basket):
+        with closing(self._conn()) as c:
+            rows = c.execute("SELECT id, data, children FROM panier WHERE basket = ? ORDER BY updated", (basket,)).fetchall()
+        return [(hid, json.loads(d), json.loads(ch)) for hid, d, ch in rows]
+
+    def remove(self, basket, ids):
+        with closing(self._conn()) as c, c:
+            c.executemany("DELETE FROM panier WHERE basket = ? AND id = ?", [(basket, hid) for hid in ids])
+
+@st.cache_resource
+def get_basket_store():
+    return BasketStore(JOURNAL_PATH)
+
+def basket_id():
+    bid = st.query_params.get("panier")
+    if not bid:
+        bid = uuid.uuid4().hex[:12]
+        st.query_params["panier"] = bid
+    return bid
+
+def send_basket(bid):
+    store = get_basket_store()
+    items = store.items(bid)
+    if not items: return 0
+    get_submission_queue().enqueue_many("append", [(hid, build_submission(data=data, children=children)) for hid, data, children in items])
+    store.remove(bid, [hid for hid, _, _ in items])
+    track_jobs([hid for hid, _, _ in items])
+    return len(items)
 
 # --- FONCTIONS UTILITAIRES (HORS MAIN) ---
 
-def play_audio_auto(text, lang):
+# block=False : l'audio n'est joué que s'il est déjà prêt ; sinon il est synthétisé en fond
+# (pour la prochaine fois) et l'écran s'affiche sans attendre gTTS
+def play_audio_auto(text, lang, block=True):
     if not LIBS_OK: return
     try:
-        tts = gTTS(text, lang=lang)
-        fp = io.BytesIO()
-        tts.write_to_fp(fp)
-        st.audio(fp, format='audio/mp3', autoplay=True)
+        with trace("audio", langue=lang) as sp:
+            data = get_audio_cache().get(text, lang) if block else get_audio_cache().peek(text, lang)
+            if sp and data: sp.set(octets=len(data))
+        if data is None:
+            prefetch_audio(text, lang)
+            return
+        st.audio(data, format='audio/mp3', autoplay=True)
         st.markdown("<style>audio { display: none !important; }</style>", unsafe_allow_html=True)
     except: pass
 
+def prefetch_audio(text, lang):
+    if not LIBS_OK: return
+    cache = get_audio_cache()
+    if os.path.exists(cache.path_for(text, lang)): return
+    get_background_tasks().submit(("audio", lang, text), cache.get, text, lang)
+
 def connect_google_sheet():
-    if "gcp_service_account" in st.secrets:
-        try:
-            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-            creds_dict = st.secrets["gcp_service_account"]
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-            client = gspread.authorize(creds)
-            sheet = client.open(SHEET_NAME).sheet1
-            return sheet, "OK"
-        except Exception as e: return None, str(e)
-    elif os.path.exists(CREDENTIALS_FILE):
-        try:
-            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-            creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-            client = gspread.authorize(creds)
-            sheet = client.open(SHEET_NAME).sheet1
-            return sheet, "OK"
-        except Exception as e: return None, str(e)
-    else: return None, "Erreur Auth"
+    try:
+        with trace("connexion"): return get_sheet_pool().get(main_sheet()), "OK"
+    except Exception as e: return None, str(e)
 
+# En-têtes calculés une fois par processus : listes partagées, à ne pas modifier en place
+@st.cache_resource
 def generate_headers():
-    headers = [q["key"] for q in QUESTIONS_MAIN]
+    headers = [q["key"] for q in get_survey().questions]
     if "Lat" not in headers: headers.append("Lat")
     if "Long" not in headers: headers.append("Long")
     headers.append("Date_Enquete")
-    child_fields = ["Nom", "Sexe", "Mere", "Niveau", "Pro", "Grade", "Act_Femme", "Sante", "Maladie", "Aide", "Orga"]
     for i in range(1, MAX_ENFANTS_PREVISION + 1):
-        for field in child_fields: headers.append(f"Enfant_{i}_{field}")
+        for field in CHILD_FIELDS: headers.append(f"Enfant_{i}_{field}")
+    headers.append("ID_Menage")
+    headers.append("Version")
     return headers
 
-def format_data_for_sheet():
+@st.cache_resource
+def household_headers():
+    return [h for h in generate_headers() if not h.startswith("Enfant_")]
+
+@st.cache_resource
+def child_headers():
+    return ["ID_Menage", "Rang"] + CHILD_FIELDS
+
+def sheet_headers(name):
+    if name == CHILD_SHEET: return child_headers()
+    if name == HOUSEHOLD_SHEET: return household_headers()
+    return generate_headers()
+
+# data / children : ménage du panier ; par défaut, celui de la session en cours
+def format_data_for_sheet(data=None, children=None):
+    if data is None: data = st.session_state.data
+    if children is None: children = st.session_state.children
     ordered_row = []
-    keys_order = [q["key"] for q in QUESTIONS_MAIN]
-    for k in keys_order: ordered_row.append(st.session_state.data.get(k, ""))
-    ordered_row.append(st.session_state.data.get("Lat", ""))
-    ordered_row.append(st.session_state.data.get("Long", ""))
-    ordered_row.append(str(datetime.now()))
-
-    child_fields = ["Nom", "Sexe", "Mere", "Niveau", "Pro", "Grade", "Act_Femme", "Sante", "Maladie", "Aide", "Orga"]
-    for child in st.session_state.children:
-        for field in child_fields: ordered_row.append(child.get(field, ""))
+    keys_order = [q["key"] for q in get_survey().questions]
+    for k in keys_order: ordered_row.append(data.get(k, ""))
+    ordered_row.append(data.get("Lat", ""))
+    ordered_row.append(data.get("Long", ""))
+    ordered_row.append(data.get("Date_Enquete") or str(datetime.now()))
+
+    # Au-delà, ID_Menage et Version seraient décalés hors de leurs colonnes
+    if STORAGE_MODE != "long" and len(children) > MAX_ENFANTS_PREVISION:
+        raise ValueError(f"{len(children)} enfants : maximum {MAX_ENFANTS_PREVISION} en stockage large")
+    for child in children:
+        for field in CHILD_FIELDS: ordered_row.append(child.get(field, ""))
     
-    missing_children = MAX_ENFANTS_PREVISION - len(st.session_state.children)
+    missing_children = MAX_ENFANTS_PREVISION - len(children)
     if missing_children > 0:
         for _ in range(missing_children):
-            for _ in child_fields: ordered_row.append("")
+            for _ in CHILD_FIELDS: ordered_row.append("")
+    ordered_row.append(data.get("ID_Menage", ""))
+    ordered_row.append(data.get("Version") or 1)
     return ordered_row
 
+def format_household_row(data=None, children=None):
+    row = dict(zip(generate_headers(), format_data_for_sheet(data, children)))
+    return [row.get(h, "") for h in household_headers()]
+
+def format_child_rows(data=None, children=None):
+    if data is None: data = st.session_state.data
+    if children is None: children = st.session_state.children
+    hid = data.get("ID_Menage", "")
+    return [[hid, i + 1] + [child.get(f, "") for f in CHILD_FIELDS] for i, child in enumerate(children)]
+
+def format_main_row(data=None, children=None):
+    return format_household_row(data, children) if STORAGE_MODE == "long" else format_data_for_sheet(data, children)
+
+def build_submission(row_idx=None, data=None, children=None):
+    base = st.session_state.get("update_base") if row_idx else None
+    if base: st.session_state.data["Version"] = _version(base[sheet_headers(main_sheet()).index("Version")]) + 1
+    payload = {"row": format_main_row(data, children)}
+    if STORAGE_MODE == "long":
+        payload["children"] = format_child_rows(data, children)
+        if row_idx: payload["child_rows"], payload["child_base"] = st.session_state.get("update_children") or ([], [])
+    # base : ligne distante au chargement (détecte les modifs des autres)
+    # base_fmt : même ligne telle que l'app la réécrirait sans changement (détecte mes modifs)
+    if base:
+        payload["base"] = base
+        payload["base_fmt"] = st.session_state.get("update_base_fmt") or base
+    return payload
+
+def start_update(row_idx, row_data):
+    layout = sheet_headers(main_sheet())
+    st.session_state.data["ID_Menage"] = row_data.get("ID_Menage", "")
+    st.session_state.update_base = [str(row_data.get(h, "")) for h in layout]
+    st.session_state.update_base_fmt = None
+    # Lignes enfants (numéros et valeurs) telles que chargées : vérifiées avant toute réécriture
+    st.session_state.update_children = get_child_store().snapshot(row_data.get("ID_Menage", "")) if STORAGE_MODE == "long" else None
+    st.session_state.update_row_idx = row_idx
+    st.session_state.is_updating = True
+
+def children_from_wide_row(row_data):
+    children = []
+    i = 1
+    while f"Enfant_{i}_Nom" in row_data:
+        c_nom = row_data.get(f"Enfant_{i}_Nom", "")
+        if c_nom and str(c_nom).strip() != "":
+            children.append(Child(**{f: row_data.get(f"Enfant_{i}_{f}", "") for f in CHILD_FIELDS}))
+        i += 1
+    return children
+
+def load_household(row_idx, row_data):
+    survey = get_survey()
+    st.session_state.data = {}
+    for q in survey.questions: st.session_state.data[q["key"]] = row_data.get(q["key"], "")
+    st.session_state.data["Lat"] = row_data.get("Lat", "")
+    st.session_state.data["Long"] = row_data.get("Long", "")
+    if STORAGE_MODE == "long":
+        store = get_child_store()
+        store.catch_up()
+        hid = row_data.get("ID_Menage", "")
+        # Ménage tout juste envoyé : ses enfants peuvent manquer à la réplique, on lit le delta
+        if hid and _version(row_data.get(survey.child_count_key)) and not store.rows_for(hid): store.refresh(get_sheet_pool(), force=True)
+        st.session_state.children = store.children_of(hid)
+    else: st.session_state.children = children_from_wide_row(row_data)
+    if survey.child_count_key: st.session_state.data[survey.child_count_key] = len(st.session_state.children)
+    start_update(row_idx, row_data)
+    st.session_state.data["Version"] = row_data.get("Version", "")
+    st.session_state.update_base_fmt = [str(v) for v in format_main_row()]
+    st.session_state.q_index = 0
+
 def search_and_load_data(search_term):
-    sheet, msg = connect_google_sheet()
-    if not sheet: return False, msg
     try:
-        records = sheet.get_all_records()
-        results = []
-        for idx, row in enumerate(records):
-            # Index + 2 car Row 1 = Headers
-            chef = str(row.get('ChefFamille', '')).lower()
-            famille = str(row.get('NomFamille', '')).lower()
-            term = search_term.lower()
-            if term in chef or term in famille:
-                results.append((idx + 2, row))
-        return True, results
+        with trace("recherche") as sp:
+            index = get_search_index()
+            index.catch_up()
+            if LIBS_OK: get_replica_sync()
+            # Réplique jamais synchronisée (premier démarrage) : une synchro complète avant de chercher
+            if not index.last_sync:
+                if not LIBS_OK: return False, "Librairies Google manquantes"
+                index.refresh(get_sheet_pool(), force=True)
+            found = index.search(search_term)
+            if sp: sp.set(resultats=len(found), index=len(index.rows))
+        return True, found
     except Exception as e:
         return False, str(e)
 
 # --- FONCTIONS D'AFFICHAGE ECRAN (HORS MAIN) ---
 
 def show_main_question(q, lc):
-    st.progress((st.session_state.q_index + 1) / (len(QUESTIONS_MAIN) + 1))
+    survey = get_survey()
+    st.progress((st.session_state.q_index + 1) / (len(survey.questions) + 1))
     txt = q[lc]
     st.markdown(f"## {txt}")
     
     if "last_spoken_q" not in st.session_state or st.session_state.last_spoken_q != q["id"]:
         play_audio_auto(txt, lc)
         st.session_state.last_spoken_q = q["id"]
+        # Pendant que l'enquêteur répond, l'audio de la question suivante se prépare en fond
+        nxt = st.session_state.q_index + 1
+        prefetch_audio(survey.questions[nxt][lc] if nxt < len(survey.questions) else SUCCESS_MSG, lc)
 
     val_key = q["key"]
     old_val = st.session_state.data.get(val_key)
@@ -133,23 +1586,26 @@ def show_main_question(q, lc):
     with st.form(key=f"form_{val_key}"):
         res = None
         if q["type"] == "text": res = st.text_input("Réponse / الجواب", value=old_val if old_val else "")
-        elif q["type"] == "number": res = st.number_input("Nombre", min_value=0, value=int(old_val) if old_val else 0)
+        elif q["type"] == "number":
+            # Stockage large : le sheet n'a que MAX_ENFANTS_PREVISION blocs de colonnes enfant
+            cap = MAX_ENFANTS_PREVISION if STORAGE_MODE != "long" and val_key == survey.child_count_key else None
+            value = int(old_val) if old_val else 0
+            res = st.number_input("Nombre", min_value=0, max_value=cap, value=min(value, cap) if cap else value)
         elif q["type"] == "radio":
-            opts = q[f"opts_{lc}"]
-            ix = opts.index(old_val) if old_val in opts else 0
+            opts = survey.options[q["id"]][lc]
+            ix = survey.option_index[q["id"]][lc].get(old_val, 0)
             res = st.radio("Choix", opts, index=ix)
         elif q["type"] == "radio_autre":
-            opts = q[f"opts_{lc}"]
-            current_selection = old_val
+            opts = survey.options[q["id"]][lc]
             precision_val = ""
             if old_val and (":" in str(old_val)):
-                 current_selection = opts[-1]
+                 ix = len(opts) - 1
                  precision_val = str(old_val).split(":", 1)[1].strip()
-            elif old_val not in opts: current_selection = opts[0]
-            ix = opts.index(current_selection) if current_selection in opts else 0
+            else: ix = survey.option_index[q["id"]][lc].get(old_val, 0)
             res_radio = st.radio("Choix", opts, index=ix)
             res_prec = st.text_input("Si 'Autre', précisez / حدد", value=precision_val)
-            if "Autre" in res_radio or "أخرى" in res_radio: res = f"Autre: {res_prec}" if res_prec else "Autre (Non précisé)"
+            # La dernière option d'une question radio_autre est toujours "Autre"
+            if res_radio == opts[-1]: res = f"Autre: {res_prec}" if res_prec else "Autre (Non précisé)"
             else: res = res_radio
         elif q["type"] == "camera":
             cam = st.camera_input("Photo")
@@ -164,31 +1620,33 @@ def show_main_question(q, lc):
 
         c1, c2 = st.columns(2)
         if c1.form_submit_button("⬅ Retour"):
-            if st.session_state.edit_mode: st.session_state.q_index = len(QUESTIONS_MAIN)
+            if st.session_state.edit_mode: st.session_state.q_index = len(survey.questions)
             elif st.session_state.q_index > 0: st.session_state.q_index -= 1
             st.rerun()
 
         if c2.form_submit_button("Suivant ➡", type="primary"):
+            if q["type"] == "camera" and cam:
+                try: res = get_photo_store().put(cam.getvalue())
+                except Exception as e:
+                    st.error(f"Photo : {e}")
+                    return
             st.session_state.data[val_key] = res
             if q["type"] == "gps":
                 st.session_state.data["Lat"] = lat
                 st.session_state.data["Long"] = lng
             
-            # Sauts
-            if q["id"] == "Q5" and res and ("Non" in str(res) or "لا" in str(res)):
-                st.session_state.q_index = next(i for i, x in enumerate(QUESTIONS_MAIN) if x["id"] == "Q13")
+            # Sauts (définis dans le questionnaire)
+            target = jump_target(survey, q["id"], res)
+            if target is not None:
+                st.session_state.q_index = target
                 st.rerun()
                 return
-            if q["id"] == "Q13" and res and ("Non" in str(res) or "لا" in str(res)):
-                st.session_state.q_index = next(i for i, x in enumerate(QUESTIONS_MAIN) if x["id"] == "Q26")
-                st.rerun()
-                return
-            if q["id"] == "Q14":
+            if q["id"] == survey.child_trigger:
                 nb = int(res)
-                st.session_state.data["NbEnfants"] = nb
+                st.session_state.data[val_key] = nb
                 if nb > 0:
                     if len(st.session_state.children) < nb:
-                        for _ in range(nb - len(st.session_state.children)): st.session_state.children.append({})
+                        for _ in range(nb - len(st.session_state.children)): st.session_state.children.append(Child())
                     st.session_state.in_child_loop = True
                     st.session_state.child_idx = 0
                     st.rerun()
@@ -196,120 +1654,96 @@ def show_main_question(q, lc):
 
             if st.session_state.edit_mode:
                 st.session_state.edit_mode = False
-                st.session_state.q_index = len(QUESTIONS_MAIN)
+                st.session_state.q_index = len(survey.questions)
             else: st.session_state.q_index += 1
             st.rerun()
 
+def child_choice(widget, label, field, lc, child, default_ix, key):
+    survey = get_survey()
+    opts = survey.child_options[field][lc]
+    ix = survey.child_option_index[field][lc].get(child.get(field), default_ix)
+    return widget(label, opts, index=ix, key=key)
+
+# Champs conditionnels : mêmes règles (celles du questionnaire) à l'affichage et à l'enregistrement
+def _child_shows(field, value): return value in get_survey().child_conditions.get(field, ())
+
+def child_from_widgets(idx):
+    w = lambda name: st.session_state[f"c_{name}_{idx}"]
+    pro, sexe, sante, aide = w("pro"), w("sexe"), w("sante"), w("aide")
+    return Child(Nom=w("nom"), Sexe=sexe, Mere=w("mere"), Niveau=w("niv"), Pro=pro,
+                 Grade=w("grade") if _child_shows("Grade", pro) else "N/A",
+                 Act_Femme=w("act") if _child_shows("Act_Femme", sexe) else "N/A",
+                 Sante=sante, Maladie=w("maladie") if _child_shows("Maladie", sante) else "N/A",
+                 Aide=aide, Orga=w("orga") if _child_shows("Orga", aide) else "N/A")
+
+# Callback des boutons : l'enfant affiché est enregistré et l'index avancé AVANT la réexécution,
+# qui affiche donc directement l'enfant suivant (pas de second passage via st.rerun)
+def move_child(step):
+    idx = st.session_state.child_idx
+    st.session_state.children[idx] = child_from_widgets(idx)
+    target = idx + step
+    survey = get_survey()
+    if 0 <= target < st.session_state.data[survey.child_count_key]: st.session_state.child_idx = target
+    else:
+        st.session_state.in_child_loop = False
+        st.session_state.q_index = survey.child_after if step > 0 else survey.index_of[survey.child_trigger]
+
+# Fragment : une interaction dans la boucle ne réexécute que le formulaire de l'enfant affiché,
+# quel que soit le nombre d'enfants. Seule la sortie de boucle relance toute la page.
+@st.fragment
 def handle_child_loop(lc):
+    if not st.session_state.in_child_loop: st.rerun()
     idx = st.session_state.child_idx
-    total = st.session_state.data["NbEnfants"]
+    total = st.session_state.data[get_survey().child_count_key]
     st.markdown(f"### 👶 Enfant {idx + 1} / {total}")
-    intro = f"Informations pour l'enfant {idx + 1}" if lc == "fr" else f"معلومات الطفل {idx + 1}"
     if "last_spoken_child" not in st.session_state or st.session_state.last_spoken_child != idx:
-        play_audio_auto(intro, lc)
+        play_audio_auto(child_intro_text(idx, lc), lc)
         st.session_state.last_spoken_child = idx
 
     d = st.session_state.children[idx]
     
     # CHAMPS
-    nom = st.text_input("15. Nom / الاسم", value=d.get("Nom", ""), key=f"c_nom_{idx}")
-    
-    opts_sexe = ["Homme", "Femme"] if lc=="fr" else ["رجل", "امرأة"]
-    idx_sexe = 0 if d.get("Sexe") != opts_sexe[1] else 1
-    sexe = st.radio("16. Sexe / الجنس", opts_sexe, index=idx_sexe, key=f"c_sexe_{idx}")
+    st.text_input("15. Nom / الاسم", value=d.Nom, key=f"c_nom_{idx}")
     
-    mere = st.text_input("17. Nom Mère / اسم الأم", value=d.get("Mere", ""), key=f"c_mere_{idx}")
+    sexe = child_choice(st.radio, "16. Sexe / الجنس", "Sexe", lc, d, 0, f"c_sexe_{idx}")
     
-    niv_opts_fr = ["Sans", "Primaire", "Secondaire", "Universitaire", "Mahadra"]
-    niv_opts_ar = ["بدون مستوى", "ابتدائي", "ثانوي", "جامعي", "محظرة"]
-    niv_opts = niv_opts_fr if lc == "fr" else niv_opts_ar
-    saved_niv = d.get("Niveau", niv_opts[0])
-    try: idx_niv = niv_opts.index(saved_niv)
-    except: idx_niv = 0
-    niv = st.selectbox("18. Niveau / المستوى", niv_opts, index=idx_niv, key=f"c_niv_{idx}")
+    st.text_input("17. Nom Mère / اسم الأم", value=d.Mere, key=f"c_mere_{idx}")
     
-    pro_opts_fr = ["-", "Fonctionnaire", "Employé(e) privé", "Travaux libéraux", "Sans emploi", "Étudiant", "Autre"]
-    pro_opts_ar = ["-", "موظف", "عامل في القطاع الخاص", "أعمال حرة", "عاطل عن العمل", "طالب", "أخرى"]
-    pro_opts = pro_opts_fr if lc == "fr" else pro_opts_ar
-    saved_pro = d.get("Pro", "-")
-    try: idx_pro = pro_opts.index(saved_pro)
-    except: idx_pro = 0
-    pro = st.selectbox("19. Situation / الوضعية", pro_opts, index=idx_pro, key=f"c_pro_{idx}")
-
-    grade = "N/A"
-    if pro in ["Fonctionnaire", "موظف"]:
+    child_choice(st.selectbox, "18. Niveau / المستوى", "Niveau", lc, d, 0, f"c_niv_{idx}")
+    pro = child_choice(st.selectbox, "19. Situation / الوضعية", "Pro", lc, d, 0, f"c_pro_{idx}")
+
+    if _child_shows("Grade", pro):
         st.info("ℹ️ Grade requis")
-        gr_opts_fr = ["Ministre", "DG", "Directeur", "Chef Sce", "Autre"]
-        gr_opts_ar = ["وزير", "مدير عام", "مدير", "رئيس مصلحة", "أخرى"]
-        gr_opts = gr_opts_fr if lc == "fr" else gr_opts_ar
-        saved_gr = d.get("Grade", gr_opts[0])
-        try: idx_gr = gr_opts.index(saved_gr)
-        except: idx_gr = 0
-        grade = st.selectbox("20. Grade / الدرجة", gr_opts, index=idx_gr, key=f"c_grade_{idx}")
-
-    act_femme = "N/A"
-    if sexe in ["Femme", "امرأة"]:
-        act_femme = st.text_input("21. Activité (Femme)", value=d.get("Act_Femme", ""), key=f"c_act_{idx}")
-
-    sante_opts = ["Bon / جيدة", "Malade / مريض"]
-    saved_sante = d.get("Sante", sante_opts[0])
-    try: idx_sante = sante_opts.index(saved_sante)
-    except: idx_sante = 0
-    sante = st.radio("22. Santé / الصحة", sante_opts, index=idx_sante, key=f"c_sante_{idx}")
-
-    maladie = "N/A"
-    if "Malade" in sante or "مريض" in sante:
-        mal_opts_fr = ["Chronique", "Aiguë", "Handicap", "Autre"]
-        mal_opts_ar = ["مزمن", "حاد", "إعاقة", "آخر"]
-        mal_opts = mal_opts_fr if lc == "fr" else mal_opts_ar
-        saved_mal = d.get("Maladie", mal_opts[0])
-        try: idx_mal = mal_opts.index(saved_mal)
-        except: idx_mal = 0
-        maladie = st.selectbox("23. Maladie / المرض", mal_opts, index=idx_mal, key=f"c_maladie_{idx}")
-
-    aide_opts = ["Oui / نعم", "Non / لا"]
-    saved_aide = d.get("Aide", aide_opts[1])
-    try: idx_aide = aide_opts.index(saved_aide)
-    except: idx_aide = 1
-    aide = st.radio("24. Aide ? / مساعدة؟", aide_opts, index=idx_aide, key=f"c_aide_{idx}")
-
-    orga = "N/A"
-    if "Oui" in aide or "نعم" in aide:
-        orga = st.text_input("25. Organisme / الهيئة", value=d.get("Orga", ""), key=f"c_orga_{idx}")
+        child_choice(st.selectbox, "20. Grade / الدرجة", "Grade", lc, d, 0, f"c_grade_{idx}")
+
+    if _child_shows("Act_Femme", sexe):
+        st.text_input("21. Activité (Femme)", value=d.Act_Femme, key=f"c_act_{idx}")
+
+    sante = child_choice(st.radio, "22. Santé / الصحة", "Sante", lc, d, 0, f"c_sante_{idx}")
+
+    if _child_shows("Maladie", sante):
+        child_choice(st.selectbox, "23. Maladie / المرض", "Maladie", lc, d, 0, f"c_maladie_{idx}")
+
+    aide = child_choice(st.radio, "24. Aide ? / مساعدة؟", "Aide", lc, d, 1, f"c_aide_{idx}")
+
+    if _child_shows("Orga", aide):
+        st.text_input("25. Organisme / الهيئة", value=d.Orga, key=f"c_orga_{idx}")
 
-    c1, c2 = st.columns(2)
-    child_save = {"Nom": nom, "Sexe": sexe, "Mere": mere, "Niveau": niv, "Pro": pro, "Grade": grade, "Act_Femme": act_femme, "Sante": sante, "Maladie": maladie, "Aide": aide, "Orga": orga}
-    
     # BOUTONS NAVIGATION ENFANTS
     # Utilisation de clés uniques pour éviter AttributeError/DuplicateID
-    if c1.button("⬅ Précédent", key=f"b_prev_child_{idx}"):
-        st.session_state.children[idx] = child_save
-        if idx > 0:
-            st.session_state.child_idx -= 1
-            st.rerun()
-        else:
-            st.session_state.in_child_loop = False
-            target = next(i for i, x in enumerate(QUESTIONS_MAIN) if x["id"] == "Q14")
-            st.session_state.q_index = target
-            st.rerun()
-
-    if c2.button("Suivant ➡", key=f"b_next_child_{idx}", type="primary"):
-        st.session_state.children[idx] = child_save
-        if idx < total - 1:
-            st.session_state.child_idx += 1
-            st.rerun()
-        else:
-            st.session_state.in_child_loop = False
-            target = next(i for i, x in enumerate(QUESTIONS_MAIN) if x["id"] == "Q26")
-            st.session_state.q_index = target
-            st.rerun()
+    c1, c2 = st.columns(2)
+    c1.button("⬅ Précédent", key=f"b_prev_child_{idx}", on_click=move_child, args=(-1,))
+    c2.button("Suivant ➡", key=f"b_next_child_{idx}", type="primary", on_click=move_child, args=(1,))
 
 def show_recap_screen(lc):
+    # Réplique tenue à jour pendant la relecture : la détection des doublons à l'envoi s'en sert
+    if LIBS_OK: get_replica_sync()
     st.success("✅ Saisie Terminée !")
     data_rows = []
-    for q in QUESTIONS_MAIN:
+    for q in get_survey().questions:
         k = q["key"]
-        if k in st.session_state.data: data_rows.append({"Q": q["id"], "Libellé": q[lc], "Réponse": st.session_state.data[k]})
+        if k in st.session_state.data: data_rows.append({"Q": q["id"], "Libellé": q[lc], "Réponse": str(st.session_state.data[k])})
+    import pandas as pd
     st.table(pd.DataFrame(data_rows))
 
     if st.session_state.children:
@@ -325,42 +1759,129 @@ def show_recap_screen(lc):
         sel = st.selectbox("Modifier Question :", opts)
         if st.button("Aller Modifier"):
             qid = sel.split(" - ")[0]
-            st.session_state.q_index = next(i for i, x in enumerate(QUESTIONS_MAIN) if x["id"] == qid)
+            st.session_state.q_index = get_survey().index_of[qid]
             st.session_state.edit_mode = True
             st.rerun()
 
+    # DOUBLONS PROBABLES (ménage déjà enregistré par un autre enquêteur ?)
+    if not st.session_state.is_updating:
+        index = get_search_index()
+        index.catch_up()
+        for score, row_idx, row in index.find_duplicates(st.session_state.data)[:3]:
+            st.warning(f"⚠️ Doublon probable ({score:.0%}) : {row.get('ChefFamille', '')} / {row.get('NomFamille', '')} · Tel {row.get('Tel', '')} · CNI {row.get('CNI', '')} (ligne {row_idx})")
+            if st.button("🔁 Mettre à jour ce ménage à la place", key=f"dup_{row_idx}"):
+                if STORAGE_MODE == "long": get_child_store().catch_up()
+                start_update(row_idx, row)
+                st.rerun()
+
     with c2:
         st.write("")
         btn_text = "💾 METTRE À JOUR / تحديث" if st.session_state.is_updating else "🚀 ENVOYER / إرسال"
         if st.button(btn_text, type="primary"):
-            with st.spinner("Enregistrement..."):
-                sheet, msg = connect_google_sheet()
-                if sheet:
-                    try:
-                        if not sheet.row_values(1): sheet.append_row(generate_headers())
-                        row_data = format_data_for_sheet()
-                        
-                        if st.session_state.is_updating and st.session_state.update_row_idx:
-                            # Update (gspread v6+ method safe: range_name=..., values=...)
-                            # On passe une liste de listes [[val1, val2...]]
-                            sheet.update(range_name=f"A{st.session_state.update_row_idx}", values=[row_data])
-                            st.success("Mise à jour effectuée !")
-                        else:
-                            # Append
-                            sheet.append_row(row_data)
-                            st.success("Envoyé !")
-                            
-                        st.balloons()
-                        play_audio_auto("Opération réussie !", lc)
-                        time.sleep(3)
-                        st.session_state.data = {}
-                        st.session_state.children = []
-                        st.session_state.q_index = -1
-                        st.session_state.is_updating = False
-                        st.session_state.update_row_idx = None
-                        st.rerun()
-                    except Exception as e: st.error(f"Erreur: {e}")
-                else: st.error(msg)
+            try:
+                if not st.session_state.data.get("ID_Menage"): st.session_state.data["ID_Menage"] = uuid.uuid4().hex
+                queue = get_submission_queue()
+                if st.session_state.is_updating and st.session_state.update_row_idx:
+                    row_idx = st.session_state.update_row_idx
+                    payload = build_submission(row_idx)
+                    job = queue.enqueue("update", payload, row_idx=row_idx)
+                    get_search_index().overlay(row_idx, dict(zip(sheet_headers(main_sheet()), payload["row"])))
+                    st.session_state.flash = f"Mise à jour enregistrée (n° {job[:8]}) !"
+                else:
+                    job = queue.enqueue("append", build_submission(), key=st.session_state.data["ID_Menage"])
+                    get_basket_store().remove(basket_id(), [st.session_state.data["ID_Menage"]])
+                    st.session_state.flash = f"Enregistré (n° {job[:8]}) ! Envoi en arrière-plan."
+                track_jobs([job])
+                reset_interview()
+                st.rerun()
+            except Exception as e: st.error(f"Erreur: {e}")
+        if not st.session_state.is_updating and st.button("🧺 Ajouter au panier / أضف إلى السلة"):
+            data = st.session_state.data
+            if not data.get("ID_Menage"): data["ID_Menage"] = uuid.uuid4().hex
+            if not data.get("Date_Enquete"): data["Date_Enquete"] = str(datetime.now())
+            get_basket_store().put(basket_id(), data, [Child.from_dict(c).as_dict() for c in st.session_state.children])
+            st.session_state.flash = "Ajouté au panier."
+            reset_interview()
+            st.rerun()
+
+def reset_interview():
+    st.session_state.data = {}
+    st.session_state.children = []
+    st.session_state.q_index = -1
+    st.session_state.is_updating = False
+    st.session_state.update_row_idx = None
+    st.session_state.update_base = None
+    st.session_state.update_children = None
+
+def show_basket(bid):
+    store = get_basket_store()
+    items = store.items(bid)
+    if not items: return
+    st.subheader(f"🧺 Panier / السلة : {len(items)} ménage(s)")
+    for hid, data, children in items:
+        c1, c2, c3 = st.columns([6, 1, 1])
+        c1.write(f"**{data.get('ChefFamille', '')}** · {data.get('NomFamille', '')} · {len(children)} enfant(s)")
+        if c2.button("✏️", key=f"panier_modif_{hid}"):
+            st.session_state.data = data
+            st.session_state.children = [Child.from_dict(c) for c in children]
+            st.session_state.q_index = len(get_survey().questions)
+            st.rerun()
+        if c3.button("🗑️", key=f"panier_suppr_{hid}"):
+            store.remove(bid, [hid])
+            st.rerun()
+    if st.button(f"📤 ENVOYER LE PANIER ({len(items)}) / إرسال السلة", type="primary"):
+        try:
+            n = send_basket(bid)
+            st.session_state.flash = f"{n} ménage(s) envoyé(s) en un seul lot."
+            st.rerun()
+        except Exception as e: st.error(f"Erreur: {e}")
+
+# --- SUIVI DES ENVOIS DE LA SESSION ---
+# Chaque soumission est d'abord écrite dans le journal du serveur (rien n'est perdu), son ID sert
+# de numéro de suivi. Tant qu'un envoi est en attente, le fragment se réexécute seul toutes les
+# JOB_POLL_SECONDS pour afficher l'avancement sans bloquer l'entretien suivant ; ensuite le
+# résumé est affiché une fois, sans rafraîchissement périodique.
+def track_jobs(ids):
+    st.session_state.jobs = ((st.session_state.get("jobs") or []) + list(ids))[-JOB_HISTORY:]
+
+def jobs_pending():
+    return any(j["status"] == "attente" for j in get_submission_queue().status(st.session_state.get("jobs") or []).values())
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_job_status():
+    # Plus rien en attente : une relance complète arrête le rafraîchissement périodique
+    if not show_job_status(): st.rerun()
+
+def show_job_status():
+    queue = get_submission_queue()
+    jobs = queue.status(st.session_state.jobs)
+    sent = sum(1 for j in jobs.values() if j["status"] == "envoye")
+    waiting = [j for j in jobs.values() if j["status"] == "attente"]
+    conflicts = sum(1 for j in jobs.values() if j["status"] == "conflit")
+    if waiting: st.caption(f"⏳ Mes envois : {sent} envoyé(s) · {len(waiting)} en cours")
+    else: st.caption(f"✅ Mes envois : {sent} envoyé(s)" + (f" · {conflicts} en conflit" if conflicts else ""))
+    failed = [j for j in waiting if j["last_error"]]
+    for j in failed[:3]:
+        retry = max(0, j["next_try"] - time.time())
+        st.caption(f"⚠️ n° {j['id'][:8]} : {j['last_error'][:80]} · nouvel essai dans {retry:.0f} s (enregistré sur le serveur, rien n'est perdu)")
+    if failed and st.button("🔁 Réessayer maintenant", key="jobs_retry"): queue.retry_now([j["id"] for j in failed])
+    return bool(waiting)
+
+def is_admin():
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(str(st.query_params.get("admin", "")), ADMIN_TOKEN)
+
+def show_trace_panel():
+    import pandas as pd
+    tracer = get_tracer()
+    ctx = get_script_run_ctx(suppress_warning=True)
+    with st.expander("⏱️ Temps (admin)"):
+        mine = tracer.recent(session=ctx.session_id[:8] if ctx else None, limit=15)
+        st.caption("Cette session")
+        if mine: st.dataframe(pd.DataFrame(mine)[["op", "ms", "ok"]], hide_index=True)
+        slow = tracer.recent(min_ms=TRACE_SLOW_MS, limit=20)
+        st.caption(f"Opérations lentes (≥ {TRACE_SLOW_MS} ms), toutes sessions")
+        if slow: st.dataframe(pd.DataFrame(slow).drop(columns=["ts"]), hide_index=True)
+        st.download_button("📈 Métriques Prometheus", tracer.prometheus(), file_name="metriques.prom")
 
 # --- MAIN ---
 def main():
@@ -375,6 +1896,7 @@ def main():
     if "in_child_loop" not in st.session_state: st.session_state.in_child_loop = False
     if "edit_mode" not in st.session_state: st.session_state.edit_mode = False
     if "update_row_idx" not in st.session_state: st.session_state.update_row_idx = None
+    if "update_base" not in st.session_state: st.session_state.update_base = None
     if "is_updating" not in st.session_state: st.session_state.is_updating = False
 
     # SIDEBAR MODIFICATION
@@ -395,49 +1917,79 @@ def main():
             selected_label = st.selectbox("Sélectionner :", list(options.keys()))
             if st.button("📂 CHARGER"):
                 row_idx, row_data = options[selected_label]
-                st.session_state.data = {}
-                for q in QUESTIONS_MAIN: st.session_state.data[q["key"]] = row_data.get(q["key"], "")
-                st.session_state.data["Lat"] = row_data.get("Lat", "")
-                st.session_state.data["Long"] = row_data.get("Long", "")
-                
-                st.session_state.children = []
-                child_fields = ["Nom", "Sexe", "Mere", "Niveau", "Pro", "Grade", "Act_Femme", "Sante", "Maladie", "Aide", "Orga"]
-                for i in range(1, MAX_ENFANTS_PREVISION + 1):
-                    c_nom = row_data.get(f"Enfant_{i}_Nom", "")
-                    if c_nom and str(c_nom).strip() != "":
-                        child_dict = {}
-                        for f in child_fields: child_dict[f] = row_data.get(f"Enfant_{i}_{f}", "")
-                        st.session_state.children.append(child_dict)
-                st.session_state.data["NbEnfants"] = len(st.session_state.children)
-                st.session_state.update_row_idx = row_idx
-                st.session_state.is_updating = True
-                st.session_state.q_index = 0
-                st.rerun()
+                try:
+                    load_household(row_idx, row_data)
+                    st.rerun()
+                except Exception as e: st.error(f"Erreur: {e}")
+
+        if LIBS_OK:
+            with st.expander("📦 Export des données"):
+                fmt = st.radio("Format", ["csv", "parquet"], horizontal=True)
+                if st.button("Préparer l'export"):
+                    path = os.path.join(DATA_DIR, f"export_{datetime.now():%Y%m%d_%H%M}.{fmt}")
+                    try:
+                        with st.spinner("Export..."): nb, bad = export_dataset(path, main_sheet())
+                        st.session_state.export_path = path
+                        st.success(f"{nb} lignes")
+                        if bad: st.warning(f"{bad} valeur(s) non numérique(s) gardée(s) dans les colonnes {RAW_SUFFIX}")
+                    except Exception as e: st.error(f"Erreur: {e}")
+                if st.session_state.get("export_path") and os.path.exists(st.session_state.export_path):
+                    with open(st.session_state.export_path, "rb") as f:
+                        st.download_button("⬇️ Télécharger", f, file_name=os.path.basename(st.session_state.export_path))
+
+            a = get_audio_cache().stats()
+            st.caption(f"🔊 Audio : {a['hits']} en cache / {a['misses']} gTTS")
+            qs = get_submission_queue().stats()
+            flush_txt = f"{qs['last_flush_ms']:.0f} ms" if qs["last_flush_ms"] is not None else "-"
+            st.caption(f"📤 En attente : {qs['depth']} (plus ancien {qs['oldest_age']:.0f} s) · dernier envoi {flush_txt}")
+            if qs["last_error"]: st.caption(f"⚠️ Envoi : {qs['last_error']}")
+            sync = get_search_index().sync
+            if sync:
+                age = f"il y a {time.time() - sync.index.last_sync:.0f} s" if sync.index.last_sync else "en cours"
+                st.caption(f"🔄 Réplique : {len(sync.index.rows)} ménages · synchro {age}")
+                if sync.last_error: st.caption(f"⚠️ Synchro : {sync.last_error}")
+            if st.session_state.get("jobs"):
+                if jobs_pending(): poll_job_status()
+                else: show_job_status()
+            conflicts = get_submission_queue().conflicts()
+            if conflicts:
+                chef_col = sheet_headers(main_sheet()).index("ChefFamille")
+                with st.expander(f"⚠️ {len(conflicts)} mise(s) à jour en conflit"):
+                    for _, payload, msg in conflicts: st.caption(f"{json.loads(payload)['row'][chef_col]} : {msg}")
+            photos = get_photo_store()
+            if photos.remote:
+                st.caption(f"📷 Photos à copier : {photos.pending()}")
+                if photos.last_error: st.caption(f"⚠️ Photos : {photos.last_error}")
+
+        if TRACE_ENABLED and is_admin(): show_trace_panel()
 
     # LOGIQUE MODE UPDATE
     if st.session_state.is_updating:
         st.warning(f"⚠️ MODE MODIFICATION Ligne {st.session_state.update_row_idx}")
         if st.button("❌ Annuler"):
-            st.session_state.is_updating = False
-            st.session_state.update_row_idx = None
-            st.session_state.data = {}
-            st.session_state.children = []
-            st.session_state.q_index = -1
+            reset_interview()
             st.rerun()
 
     # ECRAN ACCUEIL
     if st.session_state.q_index == -1:
         st.title("📋 Enquête Hassi Elbekay")
+        if st.session_state.get("flash"):
+            st.success(st.session_state.flash)
+            st.balloons()
+            play_audio_auto(SUCCESS_MSG, st.session_state.lang, block=False)
+            st.session_state.flash = None
         l = st.radio("Langue / اللغة", ["Français", "العربية"])
         st.session_state.lang = "fr" if l == "Français" else "ar"
         if st.button("🚀 DÉMARRER / ابدأ", type="primary"):
             st.session_state.q_index = 0
             st.rerun()
+        show_basket(basket_id())
         return
 
     lc = st.session_state.lang
+    questions = get_survey().questions
 
-    if st.session_state.q_index >= len(QUESTIONS_MAIN):
+    if st.session_state.q_index >= len(questions):
         show_recap_screen(lc)
         return
 
@@ -445,8 +1997,227 @@ def main():
         handle_child_loop(lc)
         return
 
-    q_data = QUESTIONS_MAIN[st.session_state.q_index]
+    q_data = questions[st.session_state.q_index]
     show_main_question(q_data, lc)
 
+# --- MIGRATION STOCKAGE LARGE -> LONG ---
+# Relit le premier onglet (colonnes Enfant_i_*) et écrit Menages + Enfants par lots.
+# Les lignes sans ID_Menage reçoivent un ID dérivé de leur contenu : relancer la migration
+# ne duplique pas les ménages déjà migrés, et les enfants absents de l'onglet Enfants (couple
+# ID_Menage, Rang) sont ajoutés même si leur ménage l'a été lors d'un passage interrompu.
+MIGRATION_CHUNK = 500
+
+def stable_household_id(values_row):
+    return uuid.uuid5(uuid.NAMESPACE_URL, json.dumps([str(v) for v in values_row], ensure_ascii=False)).hex
+
+def split_wide_row(row):
+    h_row = [row.get(h, "") for h in household_headers()]
+    c_rows = [[row["ID_Menage"], i + 1] + [child.get(f) for f in CHILD_FIELDS] for i, child in enumerate(children_from_wide_row(row))]
+    return h_row, c_rows
+
+def migrate_wide_to_long():
+    pool = get_sheet_pool()
+    values = pool.run(lambda sh: sh.get_all_values())
+    if not values: return 0, 0
+    headers, rows = values[0], values[1:]
+    pool.ensure_headers(HOUSEHOLD_SHEET)
+    pool.ensure_headers(CHILD_SHEET)
+    id_col = household_headers().index("ID_Menage") + 1
+    existing = set(pool.run(lambda sh: sh.col_values(id_col), HOUSEHOLD_SHEET))
+    done = {(r[0], str(r[1])) for r in pool.run(lambda sh: sh.get_values("A:B"), CHILD_SHEET) if len(r) > 1}
+    h_rows, c_rows = [], []
+    for values_row in rows:
+        if not any(values_row): continue
+        row = dict(zip(headers, values_row))
+        hid = row.get("ID_Menage") or stable_household_id(values_row)
+        row["ID_Menage"] = hid
+        h_row, children = split_wide_row(row)
+        if hid not in existing: h_rows.append(h_row)
+        c_rows += [c for c in children if (c[0], str(c[1])) not in done]
+    for name, batch in ((HOUSEHOLD_SHEET, h_rows), (CHILD_SHEET, c_rows)):
+        for k in range(0, len(batch), MIGRATION_CHUNK):
+            chunk = batch[k:k + MIGRATION_CHUNK]
+            pool.run(lambda sh: sh.append_rows(chunk), name)
+    return len(h_rows), len(c_rows)
+
+# --- EXPORT / IMPORT EN MASSE (CSV, PARQUET) ---
+# L'export lit la réplique locale (après une synchro par delta) par pages de EXPORT_PAGE lignes et
+# écrit au fil de l'eau : aucune lecture complète du sheet, mémoire bornée à une page quel que soit
+# le nombre de ménages. Un onglet sans réplique (ex. passé en ligne de commande) est lu dans le sheet.
+# L'import lit le fichier par blocs et écrit chaque bloc en un seul append_rows (ménages déjà
+# présents ignorés via ID_Menage).
+# Une valeur non convertible d'une colonne typée (ex. Age "4O") est exportée vide mais gardée
+# telle quelle dans la colonne <col>_brut, relue en priorité à l'import : rien n'est perdu.
+EXPORT_PAGE = 2000
+IMPORT_CHUNK = 5000
+TYPED_COLUMNS = {"Age": "int", "NbEnfants": "int", "Lat": "float", "Long": "float"}
+RAW_SUFFIX = "_brut"
+
+def _typed(value, kind):
+    if value is None or str(value).strip() == "": return None
+    try:
+        v = float(str(value).strip().replace(",", "."))
+        if v != v or v in (float("inf"), float("-inf")) or (kind == "int" and v != int(v)): return None
+        return int(v) if kind == "int" else v
+    except ValueError: return None
+
+# Ligne exportée : valeurs typées puis colonnes <col>_brut ; coerced[0] compte les cellules non converties
+def _export_row(values, types, coerced):
+    out, raw = [], []
+    for v, t in zip(values, types):
+        if not t:
+            out.append(str(v))
+            continue
+        typed = _typed(v, t)
+        bad = typed is None and str(v).strip() != ""
+        coerced[0] += bad
+        out.append(typed)
+        raw.append(str(v) if bad else "")
+    return out + raw
+
+def iter_replica_pages(pool, mirror, name=None, page=EXPORT_PAGE):
+    mirror.refresh(pool, force=True)
+    pos = [mirror.headers.index(h) if h in mirror.headers else None for h in sheet_headers(name)]
+    for values in mirror.replica.pages(mirror.key, page):
+        yield [[v[i] if i is not None and i < len(v) else "" for i in pos] for v in values]
+
+def iter_sheet_pages(pool, name=None, page=EXPORT_PAGE):
+    layout = sheet_headers(name)
+    sheet_cols = pool.run(lambda sh: sh.row_values(1), name)
+    if not sheet_cols: return
+    last_col = _col_letters(len(sheet_cols))
+    start = 2
+    while True:
+        values = pool.run(lambda sh: sh.get_values(f"A{start}:{last_col}{start + page - 1}"), name)
+        if not values: return
+        rows = []
+        for values_row in values:
+            if not any(values_row): continue
+            row = dict(zip(sheet_cols, values_row))
+            rows.append([row.get(h, "") for h in layout])
+        yield rows
+        start += page
+
+def export_dataset(path, name=None):
+    layout = sheet_headers(name)
+    types = [TYPED_COLUMNS.get(h) for h in layout]
+    out_layout = layout + [h + RAW_SUFFIX for h, t in zip(layout, types) if t]
+    pool = get_sheet_pool()
+    if name == main_sheet(): pages = iter_replica_pages(pool, get_search_index(), name)
+    elif STORAGE_MODE == "long" and name == CHILD_SHEET: pages = iter_replica_pages(pool, get_child_store(), name)
+    else: pages = iter_sheet_pages(pool, name)
+    total, coerced = 0, [0]
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        kinds = {"int": pa.int64(), "float": pa.float64(), None: pa.string()}
+        schema = pa.schema([(h, kinds[t]) for h, t in zip(layout, types)] + [(h, pa.string()) for h in out_layout[len(layout):]])
+        with pq.ParquetWriter(path, schema) as writer:
+            for rows in pages:
+                out = [_export_row(r, types, coerced) for r in rows]
+                writer.write_table(pa.Table.from_arrays([list(c) for c in zip(*out)], schema=schema))
+                total += len(rows)
+    else:
+        import csv
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            w = csv.writer(f)
+            w.writerow(out_layout)
+            for rows in pages:
+                for r in rows: w.writerow(["" if v is None else v for v in _export_row(r, types, coerced)])
+                total += len(rows)
+    return total, coerced[0]
+
+def _iter_import_rows(path):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=IMPORT_CHUNK):
+            for row in batch.to_pylist(): yield {k: ("" if v is None else v) for k, v in row.items()}
+    else:
+        import csv
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f): yield row
+
+def import_dataset(path):
+    pool = get_sheet_pool()
+    name = main_sheet()
+    for n in ([HOUSEHOLD_SHEET, CHILD_SHEET] if STORAGE_MODE == "long" else [None]): pool.ensure_headers(n)
+    id_col = sheet_headers(name).index("ID_Menage") + 1
+    existing = set(pool.run(lambda sh: sh.col_values(id_col), name))
+    done = [0, 0]
+    h_rows, c_rows = [], []
+    def flush():
+        if h_rows: pool.run(lambda sh: sh.append_rows(h_rows), name)
+        if c_rows: pool.run(lambda sh: sh.append_rows(c_rows), CHILD_SHEET)
+        done[0] += len(h_rows)
+        done[1] += len(c_rows)
+        h_rows.clear()
+        c_rows.clear()
+    for row in _iter_import_rows(path):
+        for h in TYPED_COLUMNS:
+            if str(row.get(h + RAW_SUFFIX) or "").strip(): row[h] = row[h + RAW_SUFFIX]
+        layout_row = [row.get(h, "") for h in generate_headers()]
+        if not any(str(v).strip() for v in layout_row): continue
+        row = dict(zip(generate_headers(), layout_row))
+        if not row.get("ID_Menage"): row["ID_Menage"] = stable_household_id(layout_row)
+        if row["ID_Menage"] in existing: continue
+        existing.add(row["ID_Menage"])
+        if STORAGE_MODE == "long":
+            h_row, children = split_wide_row(row)
+            h_rows.append(h_row)
+            c_rows.extend(children)
+        else: h_rows.append([row[h] for h in generate_headers()])
+        if len(h_rows) >= IMPORT_CHUNK: flush()
+    flush()
+    get_search_index().mark_stale()
+    return done[0], done[1]
+
+# --- LIGNE DE COMMANDE ---
+# python app.py prechauffer-audio   -> génère tous les MP3 à l'avance
+# python app.py migrer-long         -> copie le stockage large vers les onglets Menages / Enfants
+# python app.py valider-questionnaire [fichier.json] -> vérifie un questionnaire sans lancer l'app
+# python app.py exporter fichier.csv|fichier.parquet [onglet]  -> export paginé du sheet
+# python app.py importer fichier.csv|fichier.parquet            -> import en masse (ménages papier)
+# streamlit run app.py              -> lance le sondage
+
+def run_cli(args):
+    cmd = args[0]
+    if cmd == "prechauffer-audio":
+        if not LIBS_OK:
+            print("gTTS non installé")
+            return 1
+        stats, errors = warm_audio_cache()
+        for text, lang, err in errors: print(f"ECHEC [{lang}] {text}: {err}")
+        print(f"{len(audio_prompts())} messages, {stats['misses']} générés, {stats['hits']} déjà en cache")
+        return 1 if errors else 0
+    if cmd == "valider-questionnaire":
+        path = args[1] if len(args) > 1 else SURVEY_FILE
+        try: survey = load_survey(path)
+        except ValueError as e:
+            print(f"{path} invalide :\n{e}")
+            return 1
+        print(f"{path} OK : {len(survey.questions)} questions, {len(survey.jumps)} sauts")
+        return 0
+    if cmd == "exporter" and len(args) > 1:
+        name = args[2] if len(args) > 2 else main_sheet()
+        nb, bad = export_dataset(args[1], name)
+        print(f"{nb} lignes exportées dans {args[1]}" + (f" ({bad} valeur(s) non numérique(s) gardée(s) dans les colonnes {RAW_SUFFIX})" if bad else ""))
+        return 0
+    if cmd == "importer" and len(args) > 1:
+        nb_menages, nb_enfants = import_dataset(args[1])
+        print(f"{nb_menages} ménages importés" + (f" ({nb_enfants} lignes enfants)" if STORAGE_MODE == "long" else ""))
+        return 0
+    if cmd == "migrer-long":
+        nb_menages, nb_enfants = migrate_wide_to_long()
+        print(f"{nb_menages} ménages et {nb_enfants} enfants migrés")
+        print("Lancer ensuite l'application avec SONDAGE_STOCKAGE=long")
+        return 0
+    print(f"Commande inconnue : {cmd}")
+    return 2
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1: sys.exit(run_cli(sys.argv[1:]))
+    # streamlit exécute ce fichier sous le nom __main__ alors que les pages l'importent sous le nom
+    # app : on passe par le module importé pour que l'app et les pages partagent les mêmes caches
+    # (index, réplique, file d'envoi) au lieu d'en tenir deux copies
+    import app
+    app.main()
\ No newline at end of file
@@ -0,0 +1,220 @@
+# --- BANC DE CHARGE ---
+# N enquêteurs simulés déroulent des entretiens complets dans main() via AppTest, contre le faux
+# Google Sheets de fake_gspread.py. Les sessions avancent à tour de rôle, une action à la fois, et
+# partagent le processus comme sur le serveur : même pool Sheets, même file d'envoi, mêmes caches.
+# Pour chaque action (écran, recherche, chargement, envoi...) : p50/p95/p99 du temps total et des
+# phases tts / auth / reseau / rendu (rendu = total - les trois autres).
+#   python banc_charge.py --enqueteurs 30 --entretiens 2 --latence 0.08 --quota 300 --json res.json
+#   --max-p95 ACTION=MS (répétable) : code retour 1 si le p95 dépasse, pour la CI.
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import closing
+
+import fake_gspread
+from streamlit.testing.v1 import AppTest
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "app.py")
+PHASE_NAMES = ["tts", "auth", "reseau", "rendu"]
+NOMS = ["Ahmed", "Mohamed", "Sidi", "Fatimetou", "Mariem", "Cheikh", "Aminetou", "Brahim", "Khadijetou", "Moctar"]
+FAMILLES = ["Ould Ahmed", "Ould Sidi", "Mint Brahim", "Ehl Cheikh", "Ould Moctar", "Ehl Abdallah"]
+
+def percentile(values, p):
+    if not values: return None
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, int(round(p / 100 * len(s) + 0.5)) - 1))]
+
+def _button(at, text, where=None):
+    for b in (where or at).button:
+        if text in b.label: return b
+    return None
+
+class Enqueteur:
+    def __init__(self, num, questions, shared, rng, search_ratio, timeout):
+        self.num = num
+        self.questions = questions
+        self.shared = shared
+        self.rng = rng
+        self.search_ratio = search_ratio
+        self.at = AppTest.from_file(APP_FILE, default_timeout=timeout)
+        self.started = False
+        self.done = 0
+        self.plan = []
+
+    # Valeurs plausibles par clé de question (noms réutilisés pour que les recherches trouvent)
+    def value_for(self, key):
+        r = self.rng
+        if key in ("NomFamille", "GrandeFamille"): return r.choice(FAMILLES)
+        if key in ("ChefFamille", "Responsable"): return f"{r.choice(NOMS)} {r.choice(NOMS)} {self.num}-{self.done}"
+        if key == "Tel": return str(r.randint(20000000, 49999999))
+        if key == "CNI": return str(r.randint(1000000000, 9999999999))
+        return f"{key} {r.randint(1, 99)}"
+
+    def number_for(self, key):
+        return self.rng.randint(0, 3) if key == "NbEnfants" else self.rng.randint(18, 85)
+
+    # Une action = un clic suivi d'un rerun. Renvoie le type d'action mesurée, ou None si la session est finie.
+    def step(self):
+        at = self.at
+        if not self.started:
+            self.started = True
+            return "demarrage", at.run
+        while self.plan:
+            nxt = self.plan.pop(0)()
+            if nxt: return nxt
+        st = at.session_state
+        if st.q_index == -1:
+            if self.done >= self.shared["entretiens"]: return None
+            if self.done and self.shared["noms"] and self.rng.random() < self.search_ratio: return self.search()
+            at.main.radio[0].set_value(self.rng.choice(["Français", "العربية"]))
+            return "ecran", _button(at, "DÉMARRER").click().run
+        if st.q_index >= len(self.questions):
+            b = _button(at.main, "METTRE À JOUR") or _button(at.main, "ENVOYER")
+            if "METTRE" in b.label: return "mise_a_jour", b.click().run
+            self.shared["noms"].append(st.data.get("ChefFamille", ""))
+            self.done += 1
+            return "soumission", b.click().run
+        if st.in_child_loop:
+            idx = st.child_idx
+            at.text_input(key=f"c_nom_{idx}").set_value(f"{self.rng.choice(NOMS)} {idx}")
+            at.text_input(key=f"c_mere_{idx}").set_value(self.rng.choice(NOMS))
+            return "ecran", at.button(key=f"b_next_child_{idx}").click().run
+        q = self.questions[st.q_index]
+        for w in at.main.text_input:
+            if w.value: continue
+            if w.label.startswith("Réponse"): w.set_value(self.value_for(q["key"]))
+            elif w.label == "Latitude": w.set_value(f"{16.6 + self.rng.random() / 10:.5f}")
+            elif w.label == "Longitude": w.set_value(f"{-7.3 + self.rng.random() / 10:.5f}")
+        for w in at.main.number_input:
+            if not w.value: w.set_value(self.number_for(q["key"]))
+        return "ecran", _button(at.main, "Suivant").click().run
+
+    def search(self):
+        at = self.at
+        at.sidebar.text_input[0].set_value(self.rng.choice(self.shared["noms"]).split(" ")[0])
+        self.plan = [self.load]
+        return "recherche", _button(at.sidebar, "Chercher").click().run
+
+    # Chargement du premier résultat, puis l'entretien est parcouru et renvoyé en mise à jour
+    def load(self):
+        b = _button(self.at.sidebar, "CHARGER")
+        return ("chargement", b.click().run) if b else None
+
+def measure(action):
+    before = fake_gspread.PHASES.snapshot()
+    t0 = time.perf_counter()
+    at = action()
+    total = time.perf_counter() - t0
+    after = fake_gspread.PHASES.snapshot()
+    phases = {p: after.get(p, 0) - before.get(p, 0) for p in PHASE_NAMES[:-1]}
+    phases["rendu"] = max(0.0, total - sum(phases.values()))
+    return at, total, phases
+
+def drain(path, wait):
+    deadline = time.time() + wait
+    while True:
+        with closing(sqlite3.connect(path, timeout=30)) as c:
+            rows = c.execute("SELECT status, created, sent FROM submissions").fetchall()
+        pending = sum(1 for r in rows if r[0] == "attente")
+        if not pending or time.time() > deadline: return rows, pending
+        time.sleep(0.2)
+
+def run(args):
+    fake_gspread.install(latency=args.latence, jitter=args.latence / 2, auth_latency=args.auth, tts_latency=args.tts,
+                         error_rate=args.erreurs, quota_per_minute=args.quota)
+    workdir = tempfile.mkdtemp(prefix="banc_sondage_")
+    os.chdir(workdir)
+    with open("credentials.json", "w") as f: json.dump({"type": "service_account"}, f)
+    os.environ["SONDAGE_STOCKAGE"] = args.stockage
+    # app.py exécuté en __main__ par AppTest : sans cela il prendrait nos options pour des commandes CLI
+    sys.argv = [APP_FILE]
+    with open(os.path.join(APP_DIR, "questionnaire.json"), encoding="utf-8") as f: questions = json.load(f)["questions"]
+
+    rng = random.Random(args.graine)
+    shared = {"entretiens": args.entretiens, "noms": []}
+    sessions = [Enqueteur(i, questions, shared, random.Random(rng.random()), args.recherches, args.timeout) for i in range(args.enqueteurs)]
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    t_start = time.time()
+    active = list(sessions)
+    while active:
+        for s in list(active):
+            nxt = s.step()
+            if nxt is None:
+                active.remove(s)
+                continue
+            kind, action = nxt
+            at, total, phases = measure(action)
+            s.at = at
+            samples[kind].append((total, phases))
+            if at.exception or at.error: errors[kind] += 1
+    elapsed = time.time() - t_start
+
+    rows, pending = drain(os.path.join(workdir, "donnees_locales", "journal.db"), args.attente)
+    envoi = [r[2] - r[1] for r in rows if r[0] == "envoye" and r[2]]
+    report = {"parametres": vars(args), "duree_s": round(elapsed, 2), "actions": {},
+              "envoi": {"n": len(envoi), "en_attente": pending, "conflits": sum(1 for r in rows if r[0] == "conflit"),
+                        **{f"p{p}": round(percentile(envoi, p) * 1000, 1) if envoi else None for p in (50, 95, 99)}},
+              "fond": {p: round(t, 3) for p, t in fake_gspread.PHASES.snapshot("fond").items()},
+              "sheets": dict(fake_gspread.STATS)}
+    for kind, values in samples.items():
+        entry = {"n": len(values), "erreurs": errors[kind]}
+        for name, series in [("total", [v[0] for v in values])] + [(p, [v[1][p] for v in values]) for p in PHASE_NAMES]:
+            entry[name] = {f"p{p}": round(percentile(series, p) * 1000, 1) for p in (50, 95, 99)}
+        report["actions"][kind] = entry
+    return report
+
+def print_report(report):
+    print(f"Durée {report['duree_s']} s · appels Sheets {report['sheets']['calls']} · 429 {report['sheets']['quota_errors']} · auth {report['sheets']['auth']}")
+    print(f"{'action':<12} {'n':>5} {'err':>4}  " + "  ".join(f"{c:>20}" for c in ["total"] + PHASE_NAMES))
+    print(f"{'':<12} {'':>5} {'':>4}  " + "  ".join(f"{'p50/p95/p99 ms':>20}" for _ in range(len(PHASE_NAMES) + 1)))
+    for kind, e in sorted(report["actions"].items()):
+        cells = ["/".join(f"{e[c][p]:.0f}" for p in ("p50", "p95", "p99")) for c in ["total"] + PHASE_NAMES]
+        print(f"{kind:<12} {e['n']:>5} {e['erreurs']:>4}  " + "  ".join(f"{c:>20}" for c in cells))
+    env = report["envoi"]
+    if env["n"]: print(f"envoi (file -> Sheets) n={env['n']} p50/p95/p99 = {env['p50']:.0f}/{env['p95']:.0f}/{env['p99']:.0f} ms · en attente {env['en_attente']} · conflits {env['conflits']}")
+    else: print(f"envoi (file -> Sheets) : rien d'envoyé · en attente {env['en_attente']}")
+
+def check_limits(report, limits):
+    failed = []
+    for spec in limits:
+        kind, ms = spec.split("=")
+        e = report["actions"].get(kind)
+        if e and e["total"]["p95"] > float(ms): failed.append(f"{kind} p95 {e['total']['p95']:.0f} ms > {ms} ms")
+    return failed
+
+def parse_args(argv):
+    p = argparse.ArgumentParser(description="Banc de charge du sondage (faux Google Sheets)")
+    p.add_argument("--enqueteurs", type=int, default=30)
+    p.add_argument("--entretiens", type=int, default=1, help="entretiens complets par enquêteur")
+    p.add_argument("--recherches", type=float, default=0.5, help="probabilité de recherche + chargement entre deux entretiens")
+    p.add_argument("--latence", type=float, default=0.05, help="latence d'un appel Sheets (s)")
+    p.add_argument("--auth", type=float, default=0.3, help="latence de l'authentification (s)")
+    p.add_argument("--tts", type=float, default=0.4, help="latence d'une synthèse gTTS (s)")
+    p.add_argument("--erreurs", type=float, default=0.0, help="proportion d'appels rejetés en 429")
+    p.add_argument("--quota", type=int, default=0, help="appels autorisés par minute (0 = illimité)")
+    p.add_argument("--stockage", choices=["large", "long"], default=os.environ.get("SONDAGE_STOCKAGE", "large"))
+    p.add_argument("--attente", type=float, default=60, help="attente max de la file d'envoi à la fin (s)")
+    p.add_argument("--timeout", type=float, default=60, help="timeout d'un rerun AppTest (s)")
+    p.add_argument("--graine", type=int, default=1)
+    p.add_argument("--json", help="écrit le rapport JSON dans ce fichier")
+    p.add_argument("--max-p95", action="append", default=[], metavar="ACTION=MS")
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.json: args.json = os.path.abspath(args.json)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    failed = check_limits(report, args.max_p95)
+    for msg in failed: print(f"❌ {msg}")
+    sys.exit(1 if failed else 0)
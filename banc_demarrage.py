@@ -0,0 +1,86 @@
+# --- BANC DE DEMARRAGE A FROID ---
+# Mesure, dans un processus Python neuf à chaque essai, le temps jusqu'au premier rendu de l'écran
+# de langue (AppTest), puis celui d'une deuxième session dans le même processus (caches chauds),
+# et liste les dépendances lourdes déjà importées à ce moment-là.
+#   python banc_demarrage.py --essais 5 --avant HEAD~1
+# --avant REV : mesure aussi app.py / questionnaire.json de la révision git REV (comparaison avant/après).
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ["pandas", "gspread", "oauth2client", "gtts", "pyarrow"]
+
+PROBE = """
+import json, sys, time
+app_file, heavy_modules = sys.argv[1], json.loads(sys.argv[2])
+sys.argv = [app_file]  # app.py exécuté en __main__ : pas d'arguments, sinon il passe en mode CLI
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file(app_file, default_timeout=120).run()
+t2 = time.perf_counter()
+ok = any("DÉMARRER" in b.label for b in at.button) and not at.exception
+heavy = [m for m in heavy_modules if m in sys.modules]
+AppTest.from_file(app_file, default_timeout=120).run()
+t3 = time.perf_counter()
+print(json.dumps({"streamlit_ms": (t1 - t0) * 1000, "premier_rendu_ms": (t2 - t1) * 1000,
+                  "session_suivante_ms": (t3 - t2) * 1000, "ok": ok, "lourds": heavy}))
+"""
+
+def prepare(rev, workdir):
+    src = os.path.join(workdir, "src")
+    os.makedirs(src)
+    for name in ("app.py", "questionnaire.json"):
+        if rev is None:
+            if os.path.exists(os.path.join(APP_DIR, name)): shutil.copy(os.path.join(APP_DIR, name), src)
+            continue
+        got = subprocess.run(["git", "show", f"{rev}:{name}"], cwd=APP_DIR, capture_output=True)
+        if got.returncode == 0:
+            with open(os.path.join(src, name), "wb") as f: f.write(got.stdout)
+    return os.path.join(src, "app.py")
+
+def measure(app_file, runs):
+    samples = []
+    for _ in range(runs):
+        # Dossier de données neuf à chaque essai : rien de réutilisé d'un démarrage à l'autre
+        cwd = tempfile.mkdtemp(prefix="demarrage_")
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", PROBE, app_file, json.dumps(HEAVY_MODULES)], cwd=cwd, capture_output=True, text=True)
+        wall = (time.perf_counter() - t0) * 1000
+        shutil.rmtree(cwd, ignore_errors=True)
+        lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+        if not lines: raise RuntimeError(out.stderr[-2000:])
+        sample = json.loads(lines[-1])
+        sample["processus_ms"] = wall
+        samples.append(sample)
+    med = lambda k: statistics.median(s[k] for s in samples)
+    return {"processus_ms": med("processus_ms"), "streamlit_ms": med("streamlit_ms"), "premier_rendu_ms": med("premier_rendu_ms"),
+            "session_suivante_ms": med("session_suivante_ms"), "ok": all(s["ok"] for s in samples), "lourds": samples[-1]["lourds"]}
+
+def main():
+    p = argparse.ArgumentParser(description="Temps de démarrage à froid de l'app (premier rendu de l'écran de langue)")
+    p.add_argument("--essais", type=int, default=5)
+    p.add_argument("--avant", help="révision git à comparer (ex. HEAD~1)")
+    p.add_argument("--json", help="écrit les résultats JSON dans ce fichier")
+    args = p.parse_args()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, rev in ([(f"avant ({args.avant})", args.avant)] if args.avant else []) + [("actuel", None)]:
+            workdir = os.path.join(tmp, str(len(results)))
+            results[label] = measure(prepare(rev, workdir), args.essais)
+    print(f"{'version':<20} {'processus':>10} {'import st':>10} {'1er rendu':>10} {'session 2':>10}  dépendances lourdes chargées")
+    for label, r in results.items():
+        flag = "" if r["ok"] else "  ⚠️ écran de langue absent"
+        print(f"{label:<20} {r['processus_ms']:>8.0f}ms {r['streamlit_ms']:>8.0f}ms {r['premier_rendu_ms']:>8.0f}ms {r['session_suivante_ms']:>8.0f}ms  {', '.join(r['lourds']) or '-'}{flag}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
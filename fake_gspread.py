@@ -0,0 +1,238 @@
+# --- FAUX GOOGLE SHEETS (BANC D'ESSAI) ---
+# Reproduit en mémoire la partie de gspread utilisée par app.py, sans réseau ni quota Google.
+# La latence et les erreurs de quota (429) sont réglables ; install() remplace gspread.authorize,
+# les identifiants oauth2client et gTTS, et chronomètre chaque phase (tts, auth, reseau) par thread.
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+import gspread
+import gtts
+from gspread.cell import Cell
+from gspread.utils import a1_to_rowcol
+from oauth2client.service_account import ServiceAccountCredentials
+
+# Threads de fond de l'app : leur temps n'est pas imputé à l'écran affiché
+BACKGROUND_THREADS = ("flush-sheets", "upload-photos", "taches-fond", "export-metriques", "sync-replique")
+
+CONFIG = {"latency": 0.05, "jitter": 0.03, "auth_latency": 0.3, "tts_latency": 0.4,
+          "error_rate": 0.0, "quota_per_minute": 0, "backoff": 0.05, "max_retries": 5}
+
+# --- CHRONOMETRAGE PAR PHASE ---
+class PhaseTimer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, phase, seconds):
+        bucket = "fond" if threading.current_thread().name.startswith(BACKGROUND_THREADS) else "avant"
+        with self.lock:
+            self.totals[(bucket, phase)] += seconds
+            self.counts[(bucket, phase)] += 1
+
+    def snapshot(self, bucket="avant"):
+        with self.lock: return {p: t for (b, p), t in self.totals.items() if b == bucket}
+
+    def timed(self, phase, seconds):
+        if seconds > 0: time.sleep(seconds)
+        self.add(phase, seconds)
+
+PHASES = PhaseTimer()
+STATS = {"calls": 0, "quota_errors": 0, "retries": 0, "auth": 0}
+_stats_lock = threading.Lock()
+
+def _count(key, n=1):
+    with _stats_lock: STATS[key] += n
+
+class _Response:
+    def __init__(self, code, message, status):
+        self.status_code = code
+        self.text = message
+        self._error = {"code": code, "message": message, "status": status}
+
+    def json(self):
+        return {"error": self._error}
+
+def quota_error():
+    return gspread.exceptions.APIError(_Response(429, "Quota exceeded for quota metric 'Read requests'", "RESOURCE_EXHAUSTED"))
+
+def grid_error(rng, cols):
+    return gspread.exceptions.APIError(_Response(400, f"Range ({rng}) exceeds grid limits. Max columns: {cols}", "INVALID_ARGUMENT"))
+
+# --- CLASSEUR ---
+class FakeSpreadsheet:
+    def __init__(self, title):
+        self.title = title
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.backoff = False
+        self.sheet1 = FakeWorksheet(self, "Feuille 1", 26)
+        self.sheets = {self.sheet1.title: self.sheet1}
+
+    # Un appel API : latence simulée puis quota (fenêtre glissante d'une minute) et erreurs aléatoires.
+    # Avec BackOffHTTPClient, gspread rejoue les 429 avec un délai exponentiel : on fait de même.
+    def call(self):
+        for attempt in range(CONFIG["max_retries"] + 1):
+            _count("calls")
+            PHASES.timed("reseau", CONFIG["latency"] + random.uniform(0, CONFIG["jitter"]))
+            if not self._rejected(): return
+            _count("quota_errors")
+            if not self.backoff or attempt == CONFIG["max_retries"]: raise quota_error()
+            _count("retries")
+            PHASES.timed("reseau", CONFIG["backoff"] * 2 ** attempt)
+
+    def _rejected(self):
+        if CONFIG["error_rate"] and random.random() < CONFIG["error_rate"]: return True
+        limit = CONFIG["quota_per_minute"]
+        if not limit: return False
+        now = time.time()
+        with self.lock:
+            while self.window and self.window[0] < now - 60: self.window.popleft()
+            if len(self.window) >= limit: return True
+            self.window.append(now)
+        return False
+
+    def worksheet(self, name):
+        self.call()
+        if name not in self.sheets: raise gspread.exceptions.WorksheetNotFound(name)
+        return self.sheets[name]
+
+    def add_worksheet(self, title, rows=1000, cols=26, **kwargs):
+        self.call()
+        with self.lock: self.sheets[title] = FakeWorksheet(self, title, cols)
+        return self.sheets[title]
+
+    def worksheets(self):
+        self.call()
+        return list(self.sheets.values())
+
+def _bounds(rng, nrows):
+    m = re.match(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$", rng)
+    c1, r1, c2, r2 = m.groups()
+    if m.group(3) is None: c2, r2 = c1, r1
+    col = lambda letters, default: a1_to_rowcol(f"{letters}1")[1] if letters else default
+    return (int(r1) if r1 else 1, int(r2) if r2 else nrows, col(c1, 1), col(c2, None))
+
+# Grille comme Google : append_rows l'élargit, update / batch_update au-delà de col_count échouent
+class FakeWorksheet:
+    def __init__(self, book, title, cols=26):
+        self.book = book
+        self.title = title
+        self.rows = []
+        self.col_count = cols
+
+    def _read(self, rng):
+        r1, r2, c1, c2 = _bounds(rng, len(self.rows))
+        with self.book.lock: out = [list(r[c1 - 1:c2]) for r in self.rows[r1 - 1:r2]]
+        while out and not any(out[-1]): out.pop()
+        return out
+
+    def _write(self, rng, values):
+        r, c = a1_to_rowcol(rng.split(":")[0])
+        width = c - 1 + max((len(v) for v in values), default=0)
+        if width > self.col_count: raise grid_error(rng, self.col_count)
+        with self.book.lock:
+            for k, vals in enumerate(values):
+                while len(self.rows) < r + k: self.rows.append([])
+                row = self.rows[r + k - 1]
+                while len(row) < c - 1 + len(vals): row.append("")
+                for j, v in enumerate(vals): row[c - 1 + j] = "" if v is None else str(v)
+
+    def get_all_values(self, **kwargs):
+        self.book.call()
+        with self.book.lock: return [list(r) for r in self.rows]
+
+    def get_all_records(self, **kwargs):
+        values = self.get_all_values()
+        if not values: return []
+        head = values[0]
+        return [dict(zip(head, r + [""] * (len(head) - len(r)))) for r in values[1:]]
+
+    def row_values(self, row, **kwargs):
+        self.book.call()
+        with self.book.lock: return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def col_values(self, col, **kwargs):
+        self.book.call()
+        with self.book.lock: return [r[col - 1] if len(r) >= col else "" for r in self.rows]
+
+    def get_values(self, range_name=None, **kwargs):
+        self.book.call()
+        return self._read(range_name) if range_name else self.get_all_values()
+
+    def batch_get(self, ranges, **kwargs):
+        self.book.call()
+        return [self._read(rng) for rng in ranges]
+
+    def find(self, query, in_row=None, in_column=None, **kwargs):
+        self.book.call()
+        with self.book.lock:
+            for i, r in enumerate(self.rows):
+                if in_row and i + 1 != in_row: continue
+                for j, v in enumerate(r):
+                    if (in_column is None or j + 1 == in_column) and v == query: return Cell(i + 1, j + 1, v)
+        return None
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values])
+
+    def append_rows(self, values, **kwargs):
+        self.book.call()
+        with self.book.lock:
+            self.rows += [["" if v is None else str(v) for v in r] for r in values]
+            self.col_count = max([self.col_count] + [len(r) for r in values])
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self.book.call()
+        self._write(range_name, values)
+
+    def batch_update(self, data, **kwargs):
+        self.book.call()
+        for d in data: self._write(d["range"], d["values"])
+
+    def add_cols(self, cols):
+        self.book.call()
+        self.col_count += cols
+
+# --- CLIENT ET IDENTIFIANTS ---
+BOOKS = {}
+
+class FakeClient:
+    def __init__(self, backoff):
+        self.backoff = backoff
+
+    def open(self, title):
+        if title not in BOOKS: BOOKS[title] = FakeSpreadsheet(title)
+        BOOKS[title].backoff = self.backoff
+        BOOKS[title].call()
+        return BOOKS[title]
+
+def authorize(credentials, http_client=None, **kwargs):
+    _count("auth")
+    PHASES.timed("auth", CONFIG["auth_latency"])
+    return FakeClient(backoff=http_client is gspread.BackOffHTTPClient)
+
+class FakeTTS:
+    def __init__(self, text, lang="fr", **kwargs):
+        self.text = text
+        self.lang = lang
+
+    def write_to_fp(self, fp):
+        PHASES.timed("tts", CONFIG["tts_latency"])
+        fp.write(b"ID3" + f"{self.lang}:{self.text}".encode("utf-8"))
+
+    def save(self, path):
+        with open(path, "wb") as f: self.write_to_fp(f)
+
+def install(**settings):
+    unknown = set(settings) - set(CONFIG)
+    if unknown: raise ValueError(f"Réglages inconnus : {', '.join(sorted(unknown))}")
+    CONFIG.update(settings)
+    BOOKS.clear()
+    gspread.authorize = authorize
+    ServiceAccountCredentials.from_json_keyfile_name = classmethod(lambda cls, *a, **k: object())
+    ServiceAccountCredentials.from_json_keyfile_dict = classmethod(lambda cls, *a, **k: object())
+    gtts.gTTS = FakeTTS
@@ -20,7 +20,7 @@ if (-not (Test-Path "venv")) {
 # 3. Activation et Installation des dépendances
 Write-Host "Installation des librairies nécessaires..." -ForegroundColor Yellow
 .\venv\Scripts\python -m pip install --upgrade pip
-.\venv\Scripts\python -m pip install streamlit gspread oauth2client pandas gtts
+.\venv\Scripts\python -m pip install -r requirements.txt
 
 # 4. Vérification du fichier credentials
 if (-not (Test-Path "credentials.json")) {
@@ -0,0 +1,125 @@
+import threading
+
+import streamlit as st
+import numpy as np
+import pandas as pd
+
+from app import STORAGE_MODE, LIBS_OK, get_sheet_pool, get_search_index, get_child_store, get_replica_sync
+
+# --- TABLEAU DE BORD SUPERVISEURS ---
+# Les données viennent de la réplique locale (index de recherche / enfants), tenue à jour par le
+# thread de synchro de l'app (démarré ici s'il ne tourne pas encore) : aucun appel Sheets à
+# l'affichage. Les DataFrames ne gardent que les colonnes des graphiques et sont conservés d'une
+# séquence de la réplique à l'autre : seules les lignes changées depuis la dernière séquence vue
+# (ReplicaStore.changes) sont reconstruites. Tous les agrégats sont vectorisés.
+HOUSEHOLD_COLUMNS = ("ID_Menage", "Localite", "StatutLogement", "Age")
+CHILD_COLUMNS = ("Nom", "Niveau", "Sante", "Maladie")
+
+def _columns(headers):
+    return [h for h in headers if h in HOUSEHOLD_COLUMNS or h in CHILD_COLUMNS or (h.startswith("Enfant_") and h.split("_", 2)[-1] in CHILD_COLUMNS)]
+
+@st.cache_resource
+def frame_cache():
+    return {"lock": threading.Lock(), "frames": {}}
+
+def _frame(mirror, nums, columns):
+    with mirror.lock: rows = {r: mirror.rows[r] for r in nums if r in mirror.rows}
+    return pd.DataFrame({h: [row.get(h, "") for row in rows.values()] for h in columns}, index=pd.Index(list(rows), dtype="int64"))
+
+def mirror_frame(mirror):
+    cache = frame_cache()
+    with cache["lock"]:
+        seq, df = cache["frames"].get(mirror.key, (0, None))
+        now, columns = mirror.seq, _columns(mirror.headers)
+        if df is not None and now == seq: return df
+        if df is None or now < seq or list(df.columns) != columns:
+            with mirror.lock: nums = sorted(mirror.rows)
+            df = _frame(mirror, nums, columns)
+        else:
+            changed = {r for r, _, _ in mirror.replica.changes(mirror.key, seq)}
+            df = pd.concat([df.drop(index=df.index.intersection(changed)), _frame(mirror, sorted(changed), columns)])
+        cache["frames"][mirror.key] = (now, df)
+        return df
+
+@st.cache_resource(max_entries=2)
+def load_children(seq, households_seq):
+    if STORAGE_MODE == "long":
+        df = mirror_frame(get_child_store())
+        return df[df.get("ID_Menage", pd.Series(dtype=str)) != ""] if not df.empty else df
+    # Stockage large : on empile les colonnes Enfant_i_<champ> (une ligne par enfant renseigné)
+    hh = mirror_frame(get_search_index())
+    slots = sorted({int(c.split("_")[1]) for c in hh.columns if c.startswith("Enfant_") and c.endswith("_Nom")})
+    if not slots: return pd.DataFrame(columns=list(CHILD_COLUMNS))
+    blank = np.full(len(hh), "", dtype=object)
+    data = {f: np.concatenate([hh[f"Enfant_{i}_{f}"].to_numpy() if f"Enfant_{i}_{f}" in hh else blank for i in slots]) for f in CHILD_COLUMNS}
+    data["Localite"] = np.tile(hh["Localite"].to_numpy() if "Localite" in hh else blank, len(slots))
+    # Blocs enfant vides écartés avant de construire le frame (la plupart des slots le sont)
+    keep = data["Nom"] != ""
+    df = pd.DataFrame({f: v[keep] for f, v in data.items()})
+    return df[df["Nom"].str.strip() != ""]
+
+def counts(series, drop=("", "N/A", "-")):
+    s = series.astype(str)
+    return s[~s.isin(drop)].value_counts()
+
+def main():
+    st.set_page_config(page_title="Tableau de bord", layout="wide")
+    st.title("📊 Tableau de bord")
+    if not LIBS_OK:
+        st.error("Librairies Google manquantes")
+        return
+
+    get_replica_sync()
+    index, store = get_search_index(), get_child_store()
+    index.catch_up()
+    if STORAGE_MODE == "long": store.catch_up()
+    # Réplique encore vide (premier démarrage du serveur) : une synchro avant d'afficher
+    if not index.last_sync:
+        try:
+            index.refresh(get_sheet_pool(), force=True)
+            if STORAGE_MODE == "long": store.refresh(get_sheet_pool(), force=True)
+        except Exception as e: st.warning(f"Synchronisation impossible, données locales affichées : {e}")
+
+    hh = mirror_frame(index)
+    if hh.empty:
+        st.info("Aucun ménage enregistré")
+        return
+    kids = load_children(store.seq if STORAGE_MODE == "long" else 0, index.seq)
+    if STORAGE_MODE == "long" and not kids.empty:
+        loc = hh.set_index("ID_Menage")["Localite"] if "Localite" in hh else pd.Series(dtype=str)
+        kids = kids.assign(Localite=kids["ID_Menage"].map(loc).fillna(""))
+
+    localites = sorted(hh.get("Localite", pd.Series(dtype=str)).astype(str).unique())
+    chosen = st.multiselect("Localité", localites, default=localites)
+    if chosen != localites:
+        hh = hh[hh["Localite"].astype(str).isin(chosen)]
+        kids = kids[kids["Localite"].astype(str).isin(chosen)] if "Localite" in kids else kids
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Ménages", len(hh))
+    c2.metric("Enfants", len(kids))
+    ages = pd.to_numeric(hh.get("Age", pd.Series(dtype=str)), errors="coerce").to_numpy()
+    ages = ages[~np.isnan(ages) & (ages > 0)]
+    c3.metric("Âge moyen du chef", f"{ages.mean():.1f}" if ages.size else "-")
+
+    c1, c2 = st.columns(2)
+    c1.subheader("Ménages par localité")
+    c1.bar_chart(counts(hh.get("Localite", pd.Series(dtype=str))))
+    c2.subheader("Statut du logement")
+    c2.bar_chart(counts(hh.get("StatutLogement", pd.Series(dtype=str))))
+
+    st.subheader("Âge des chefs de famille")
+    if ages.size:
+        hist, edges = np.histogram(ages, bins=np.arange(0, 110, 10))
+        st.bar_chart(pd.Series(hist, index=[f"{int(a)}-{int(b) - 1}" for a, b in zip(edges[:-1], edges[1:])]))
+
+    if not kids.empty:
+        c1, c2, c3 = st.columns(3)
+        c1.subheader("Niveau d'études")
+        c1.bar_chart(counts(kids["Niveau"]))
+        c2.subheader("Santé")
+        c2.bar_chart(counts(kids["Sante"]))
+        c3.subheader("Maladies")
+        c3.bar_chart(counts(kids["Maladie"]))
+
+main()